@@ -0,0 +1,144 @@
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.cluster import KMeans
+from sklearn.metrics import DistanceMetric, pairwise_distances, pairwise_distances_argmin
+from sklearn.utils import check_random_state
+
+# Approximate nearest neighbour classification with an inverted file index
+# (IVF), in NumPy.
+#
+# The training rows are clustered with k-means into n_lists lists. A query
+# is only compared, with the exact metric, to the rows of the n_probe
+# lists whose centroids are closest to it, so the query time is about
+# n_probe / n_lists of that of a brute force search. n_probe trades recall
+# for speed: with n_probe = n_lists the search is exact.
+#
+# The lists are clustered and probed in euclidean space whatever the
+# metric, so with other metrics the probed lists are a heuristic choice;
+# a larger n_probe makes up for it.
+
+
+class ApproximateKNeighborsClassifier(BaseEstimator, ClassifierMixin):
+
+    def __init__(self, n_neighbors = 5, metric = "euclidean", n_lists = None,
+                 n_probe = 8, training_sample_size = 256, query_chunk_size = 4096,
+                 random_state = None):
+        # n_lists defaults to the square root of the number of training
+        # rows; k-means is fit on at most training_sample_size rows per list
+        self.n_neighbors = n_neighbors
+        self.metric = metric
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.training_sample_size = training_sample_size
+        self.query_chunk_size = query_chunk_size
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype = np.float64)
+        self.classes_, y_indices = np.unique(y, return_inverse = True)
+
+        n_lists = self.n_lists
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(X)))
+        n_lists = max(1, min(n_lists, len(X)))
+
+        random_state = check_random_state(self.random_state)
+        sample_size = min(len(X), n_lists * self.training_sample_size)
+        sample = np.sort(random_state.choice(len(X), sample_size, replace = False))
+        kmeans = KMeans(n_clusters = n_lists,
+                        n_init = 1,
+                        max_iter = 20,
+                        random_state = random_state).fit(X[sample])
+        self.centroids_ = kmeans.cluster_centers_
+
+        # The rows are stored list after list, so that a list is a slice
+        assignments = pairwise_distances_argmin(X, self.centroids_)
+        order = np.argsort(assignments, kind = "stable")
+        self.list_offsets_ = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignments, minlength = n_lists))])
+        self.fit_X_ = X[order]
+        self.fit_y_ = y_indices[order]
+        self.fit_indices_ = order
+        return self
+
+    def kneighbors(self, X, n_neighbors = None):
+        # The distances and training row indices of the approximate nearest
+        # neighbours of every row of X, nearest first; rows with fewer
+        # candidates than neighbours are padded with infinite distances and
+        # index -1
+        X = np.asarray(X, dtype = np.float64)
+        n_neighbors = self.n_neighbors if n_neighbors is None else n_neighbors
+        distances = np.empty((len(X), n_neighbors))
+        indices = np.empty((len(X), n_neighbors), dtype = np.int64)
+        for start in range(0, len(X), self.query_chunk_size):
+            end = min(start + self.query_chunk_size, len(X))
+            distances[start:end], indices[start:end] = self._search(X[start:end], n_neighbors)
+        found = indices >= 0
+        indices[found] = self.fit_indices_[indices[found]]
+        return distances, indices
+
+    def predict_proba(self, X):
+        # The share of the neighbours of every row in each class
+        X = np.asarray(X, dtype = np.float64)
+        probabilities = np.zeros((len(X), len(self.classes_)))
+        for start in range(0, len(X), self.query_chunk_size):
+            end = min(start + self.query_chunk_size, len(X))
+            _, positions = self._search(X[start:end], self.n_neighbors)
+            rows, columns = np.nonzero(positions >= 0)
+            np.add.at(probabilities[start:end],
+                      (rows, self.fit_y_[positions[rows, columns]]),
+                      1)
+        return probabilities / np.maximum(probabilities.sum(axis = 1, keepdims = True), 1)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis = 1)]
+
+    def _distances(self, X, Y):
+        # The distances KNeighborsClassifier computes: sklearn's own
+        # DistanceMetric, which for braycurtis differs from scipy's on
+        # negative features, and a matrix product for euclidean
+        if self.metric == "euclidean":
+            return pairwise_distances(X, Y)
+        return DistanceMetric.get_metric(self.metric).pairwise(X, Y)
+
+    def _search(self, X, n_neighbors):
+        # Returns the distances and the positions (in fit_X_) of the nearest
+        # neighbours found. The lists are gone through one at a time, each
+        # compared at once to all the queries probing it, and merged into
+        # the best neighbours found so far.
+        n_lists = len(self.centroids_)
+        n_probe = max(1, min(self.n_probe, n_lists))
+        centroid_distances = pairwise_distances(X, self.centroids_)
+        if n_probe < n_lists:
+            probed_lists = np.argpartition(centroid_distances, n_probe - 1, axis = 1)[:, :n_probe]
+        else:
+            probed_lists = np.broadcast_to(np.arange(n_lists), (len(X), n_lists))
+
+        best_distances = np.full((len(X), n_neighbors), np.inf)
+        best_positions = np.full((len(X), n_neighbors), -1, dtype = np.int64)
+        if len(X) == 0:
+            return best_distances, best_positions
+
+        probe_rows = np.repeat(np.arange(len(X)), n_probe)
+        probe_lists = probed_lists.ravel()
+        order = np.argsort(probe_lists, kind = "stable")
+        probe_rows = probe_rows[order]
+        probe_lists = probe_lists[order]
+        boundaries = np.flatnonzero(np.diff(probe_lists)) + 1
+        for rows, list_index in zip(np.split(probe_rows, boundaries),
+                                    probe_lists[np.concatenate([[0], boundaries])]):
+            start, end = self.list_offsets_[list_index], self.list_offsets_[list_index + 1]
+            if start == end:
+                continue
+            distances = self._distances(X[rows], self.fit_X_[start:end])
+            candidate_distances = np.hstack([best_distances[rows], distances])
+            candidate_positions = np.hstack([best_positions[rows],
+                                             np.broadcast_to(np.arange(start, end),
+                                                             distances.shape)])
+            nearest = np.argpartition(candidate_distances, n_neighbors - 1, axis = 1)[:, :n_neighbors]
+            best_distances[rows] = np.take_along_axis(candidate_distances, nearest, axis = 1)
+            best_positions[rows] = np.take_along_axis(candidate_positions, nearest, axis = 1)
+
+        order = np.argsort(best_distances, axis = 1, kind = "stable")
+        return (np.take_along_axis(best_distances, order, axis = 1),
+                np.take_along_axis(best_positions, order, axis = 1))
@@ -4,15 +4,26 @@ import numpy as np
 # import nltk
 from sklearn.ensemble import BaggingClassifier, RandomForestClassifier, GradientBoostingClassifier, AdaBoostClassifier
 from sklearn.metrics import precision_score, recall_score, f1_score
-from sklearn.externals import joblib
+import joblib
 import utils as U
 
+METADATA_COLUMNS = ["favorite_count",
+                    "retweet_count",
+                    "user_id",
+                    "year",
+                    "month",
+                    "week",
+                    "day",
+                    "hour",
+                    "minute"]
+
 class BaseLineModel():
     def __init__(self, tweets_filename=None, chosen_model='RF'):
         print('Initializing BaseLineModel: '+chosen_model)
         if tweets_filename is None:
             raise ValueError("No filename provided")
-        self.tweets = U.read_data_from_file(tweets_filename)
+        self.tweets = U.read_data_from_file(tweets_filename,
+                                            columns = METADATA_COLUMNS)
         self.tweets = U.extract_features(self.tweets,
                                          ["in_reply_to_user_id",
                                           "text_body",
@@ -75,7 +86,7 @@ def get_arguments():
     parser.add_argument('tweet_filepath',
                         metavar = 'tweet-filepath',
                         type = str,
-                        help = "pickle file containing tweet information")
+                        help = "pickle or parquet file containing tweet information")
     parser.add_argument('model_choice',
                         metavar = 'model-choice',
                         type = str,
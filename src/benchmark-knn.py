@@ -0,0 +1,115 @@
+import argparse
+import numpy as np
+import time
+from sklearn.neighbors import KNeighborsClassifier
+from ann import ApproximateKNeighborsClassifier
+from training import load_features, prepare_features, split_folds
+
+METRICS = ["euclidean", "manhattan", "chebyshev", "canberra", "braycurtis"]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = ("Compare the accuracy and query time " +
+                                                    "of the approximate KNN models with " +
+                                                    "those of the exact ones"))
+    parser.add_argument('x_filepath',
+                        metavar = 'x-filepath',
+                        type = str,
+                        help = "npy file containing the features")
+    parser.add_argument('y_filepath',
+                        metavar = 'y-filepath',
+                        type = str,
+                        help = "npy file containing the class labels")
+    parser.add_argument("--metrics",
+                        nargs = "+",
+                        choices = METRICS,
+                        default = METRICS,
+                        help = "distance metrics benchmarked")
+    parser.add_argument("--probe-counts",
+                        nargs = "+",
+                        type = int,
+                        default = [1, 2, 4, 8, 16, 32],
+                        help = "numbers of index lists searched by the approximate models")
+    parser.add_argument("--n-neighbors",
+                        type = int,
+                        default = 5,
+                        help = "number of neighbours voting")
+    parser.add_argument("--n-splits",
+                        type = int,
+                        default = 5,
+                        help = "1 / fraction of the rows queried")
+    parser.add_argument("--random-state",
+                        type = int,
+                        default = 55861,
+                        help = "random state for the split and the index")
+
+    return parser.parse_args()
+
+
+def fit(model, X, Y):
+    start_time = time.time()
+    model.fit(prepare_features(model, X), Y)
+    return time.time() - start_time
+
+
+def query(model, X, Y, n_neighbors):
+    # The distances of the neighbours found, the accuracy and the time
+    # taken to find the neighbours and predict
+    X = prepare_features(model, X)
+    start_time = time.time()
+    distances, _ = model.kneighbors(X, n_neighbors)
+    Y_pred = model.predict(X)
+    query_time = time.time() - start_time
+    return distances, np.mean(Y_pred == Y), query_time
+
+
+def compute_recall(distances, exact_distances):
+    # The share of the neighbours found that are as close as the exact
+    # k-th neighbour, which, unlike comparing indices, does not count
+    # neighbours at the same distance as misses
+    threshold = exact_distances[:, -1:] * (1 + 1e-6) + 1e-6
+    return np.mean(distances <= threshold)
+
+
+def main():
+    args = parse_arguments()
+
+    X = load_features(args.x_filepath)
+    Y = load_features(args.y_filepath)
+
+    train_indices, test_indices = split_folds(X, Y, args.n_splits, args.random_state)[0]
+    X_train, Y_train = X[train_indices], Y[train_indices]
+    X_test, Y_test = X[test_indices], Y[test_indices]
+
+    print("#" * 80)
+    print("Train rows:", len(Y_train), "query rows:", len(Y_test))
+    print("{0:<12} {1:>7} {2:>8} {3:>10} {4:>10} {5:>16}".format(
+        "Metric", "Probes", "Recall", "Accuracy", "Fit (s)", "Query (ms/row)"))
+
+    def print_row(metric, probe_count, recall, accuracy, fit_time, query_time):
+        print("{0:<12} {1:>7} {2:>8.3f} {3:>10.4f} {4:>10.2f} {5:>16.4f}".format(
+            metric, probe_count, recall, accuracy, fit_time, 1000 * query_time / len(Y_test)))
+
+    for metric in args.metrics:
+        model = KNeighborsClassifier(n_neighbors = args.n_neighbors, metric = metric)
+        fit_time = fit(model, X_train, Y_train)
+        exact_distances, accuracy, query_time = query(model, X_test, Y_test, args.n_neighbors)
+        print_row(metric, "exact", 1.0, accuracy, fit_time, query_time)
+
+        # The index is built once, the number of lists probed only matters
+        # to the queries
+        model = ApproximateKNeighborsClassifier(n_neighbors = args.n_neighbors,
+                                                metric = metric,
+                                                random_state = args.random_state)
+        fit_time = fit(model, X_train, Y_train)
+        for probe_count in args.probe_counts:
+            model.set_params(n_probe = probe_count)
+            distances, accuracy, query_time = query(model, X_test, Y_test, args.n_neighbors)
+            print_row(metric, probe_count,
+                      compute_recall(distances, exact_distances),
+                      accuracy, fit_time, query_time)
+
+    print("#" * 80)
+
+if __name__ =="__main__":
+    main()
@@ -0,0 +1,88 @@
+import itertools
+import numpy as np
+import tokenizer
+
+
+class TokenCorpus(object):
+    # Tokenized texts stored as integer token ids.
+    #
+    # The ids of all the texts are concatenated in token_ids; the ids of the
+    # i-th text are token_ids[offsets[i]:offsets[i + 1]]. vocabulary[id] is
+    # the word with the given id.
+
+    def __init__(self, vocabulary, token_ids, offsets):
+        self.vocabulary = vocabulary
+        self.token_ids = token_ids
+        self.offsets = offsets
+
+    @classmethod
+    def from_tokens(cls, tweet_text_body_tokens, word_id_mapping = None):
+        # Words are numbered in order of first occurrence. The mapping can be
+        # passed in to extend an existing numbering.
+        if word_id_mapping is None:
+            word_id_mapping = {}
+        lengths = []
+        token_id_chunks = []
+        for chunk in chunks(tweet_text_body_tokens, 10000):
+            lengths.extend(map(len, chunk))
+            tokens = itertools.chain.from_iterable(chunk)
+            token_id_chunks.append(np.fromiter(
+                (word_id_mapping.setdefault(token, len(word_id_mapping))
+                 for token in tokens),
+                dtype = np.int32))
+
+        offsets = np.zeros(len(lengths) + 1, dtype = np.int64)
+        np.cumsum(lengths, out = offsets[1:])
+        token_ids = (np.concatenate(token_id_chunks)
+                     if len(token_id_chunks) > 0
+                     else np.zeros(0, dtype = np.int32))
+        vocabulary = sorted(word_id_mapping, key = word_id_mapping.get)
+        return cls(vocabulary, token_ids, offsets)
+
+    @classmethod
+    def from_texts(cls, texts, worker_count = 1):
+        return cls.from_tokens(tokenizer.iterate_tokens(texts, worker_count))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def rows(self):
+        # The index of the text every token belongs to
+        return np.repeat(np.arange(len(self)), self.lengths())
+
+    def word_counts(self):
+        return np.bincount(self.token_ids, minlength = len(self.vocabulary))
+
+    def word_id_mapping(self):
+        return {word: word_id for word_id, word in enumerate(self.vocabulary)}
+
+    def tokens(self, index):
+        return [self.vocabulary[word_id]
+                for word_id in self.token_ids[self.offsets[index]:self.offsets[index + 1]]]
+
+    def take(self, indices):
+        # The texts at the given indices, sharing the vocabulary
+        lengths = self.lengths()[indices]
+        offsets = np.zeros(len(lengths) + 1, dtype = np.int64)
+        np.cumsum(lengths, out = offsets[1:])
+        positions = (np.repeat(self.offsets[:-1][indices] - offsets[:-1], lengths) +
+                     np.arange(offsets[-1]))
+        return TokenCorpus(self.vocabulary, self.token_ids[positions], offsets)
+
+    def slice(self, start, end):
+        # The texts start, ..., end - 1, sharing the vocabulary
+        return TokenCorpus(self.vocabulary,
+                           self.token_ids[self.offsets[start]:self.offsets[end]],
+                           self.offsets[start:end + 1] - self.offsets[start])
+
+
+def chunks(iterable, chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
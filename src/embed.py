@@ -1,36 +1,139 @@
-import numpy
+import numpy as np
 import pickle
+import progressbar
 import re
+import scipy.sparse
+import tokenizer
+from corpus import TokenCorpus
+
+
+def lookup_words(mapping, words, default, dtype):
+    # The values of the words in a dict, or in a mapping with a vectorized
+    # lookup (such as featurizer.HashedWordMapping)
+    if hasattr(mapping, "lookup"):
+        return mapping.lookup(words, default).astype(dtype, copy = False)
+    return np.fromiter((mapping.get(word, default) for word in words),
+                       dtype = dtype,
+                       count = len(words))
+
+
+def compute_word_weights(corpus, a = 10e-3):
+    # Returns the SIF weight of every word of the corpus vocabulary, by id
+    word_counts = corpus.word_counts()
+    frequencies = word_counts / max(word_counts.sum(), 1)
+    return a / (a + frequencies)
+
+
+def compute_sif_weight_matrix(corpus,
+                              word_weights,
+                              word_index_mapping,
+                              col_count):
+    # Returns a sparse (tweet count x col_count) matrix holding, for every
+    # tweet, the weight of each of its words that has a vector divided by
+    # the number of such words. Multiplying it with the word vectors gives
+    # the weighted average of the word vectors of every tweet.
+    vocabulary_indices = lookup_words(word_index_mapping, corpus.vocabulary, -1, np.int64)
+    word_indices = vocabulary_indices[corpus.token_ids]
+
+    known = word_indices >= 0
+    rows = corpus.rows()[known]
+    word_counts = np.bincount(rows, minlength = len(corpus))
+
+    return scipy.sparse.csr_matrix(
+        (word_weights[corpus.token_ids[known]] / word_counts[rows],
+         (rows, word_indices[known])),
+        shape = (len(corpus), col_count))
+
+
+def compute_sif_embedding_with_pc(corpus,
+                                  word_weights,
+                                  word_index_mapping,
+                                  word_vector_mapping,
+                                  chunk_size = 100000,
+                                  out = None,
+                                  progress = True):
+
+    dims = (len(corpus), word_vector_mapping.shape[1])
+    sif_with_pc = np.zeros(dims) if out is None else out
+
+    weight_matrix = compute_sif_weight_matrix(corpus,
+                                              word_weights,
+                                              word_index_mapping,
+                                              word_vector_mapping.shape[0])
+
+    # Only gather the vectors of the words that occur, so that a
+    # memory-mapped vector matrix is neither read nor converted as a whole.
+    used_word_indices = np.unique(weight_matrix.indices)
+    used_word_vectors = np.asarray(word_vector_mapping[used_word_indices],
+                                   dtype = np.float64)
+    weight_matrix = scipy.sparse.csr_matrix(
+        (weight_matrix.data,
+         np.searchsorted(used_word_indices, weight_matrix.indices),
+         weight_matrix.indptr),
+        shape = (dims[0], len(used_word_indices)))
+
+    bar = (progressbar.ProgressBar if progress else progressbar.NullBar)(
+        max_value = dims[0], prefix = "Embedding ")
+    for start in range(0, dims[0], chunk_size):
+        end = min(start + chunk_size, dims[0])
+        sif_with_pc[start:end, :] = weight_matrix[start:end] @ used_word_vectors
+        bar.update(end)
+    bar.finish()
+
+    return sif_with_pc
+
+
+def remove_principal_component(embedding_with_pc, pc):
+    # The projections are summed up row by row rather than with a matrix
+    # product, whose rounding depends on the number of rows; a tweet gets
+    # the same features whether it is embedded alone or with others.
+    return (embedding_with_pc -
+            (embedding_with_pc * pc).sum(axis = 1, keepdims = True) * pc)
 
 
 class SifEmbedder(object):
-    def __init__(self, words, vectors,  weight = 0.0001):
+    # words maps every word to the index of its vector. With word_weights,
+    # a mapping of words to their SIF weights in the training corpus,
+    # embed_batch gives the same embedding as the SIF features (words
+    # missing from the training corpus have frequency 0, hence weight 1);
+    # without, every word weighs weight. The principal_component, if any,
+    # is removed from the embedding.
+
+    def __init__(self, words, vectors,  weight = 0.0001,
+                 word_weights = None, principal_component = None):
         self._words = words
         self._vectors = vectors
         self._weight = weight
+        self._word_weights = word_weights
+        self._principal_component = principal_component
 
     def embed(self, text):
         words = self._tokenize(text)
         word_indices = self._index(words)
         if len(word_indices) == 0:
-            return numpy.zeros(self._vectors.shape[1])
+            return np.zeros(self._vectors.shape[1])
         embedding = self._vectors[word_indices, :].sum(axis = 0)
         embedding = self._weight * embedding / len(word_indices)
         return embedding
 
+    def embed_batch(self, texts):
+        # Returns the (len(texts) x dim) embedding of the texts
+        corpus = TokenCorpus.from_tokens(map(self._tokenize, texts))
+        if self._word_weights is None:
+            word_weights = np.full(len(corpus.vocabulary), self._weight)
+        else:
+            word_weights = lookup_words(self._word_weights, corpus.vocabulary, 1.0, np.float64)
+        embedding = compute_sif_embedding_with_pc(corpus,
+                                                  word_weights,
+                                                  self._words,
+                                                  self._vectors,
+                                                  progress = False)
+        if self._principal_component is not None:
+            embedding = remove_principal_component(embedding, self._principal_component)
+        return embedding
+
     def _tokenize(self, text):
-        words = []
-        word = ""
-        for c in text:
-            if c.isalpha():
-                word += c
-            else:
-                words.append(word)
-                word = ""
-                if not c.isspace():
-                    words.append(c)
-        words.append(word)
-        return filter(lambda word: len(word) > 0, words)
+        return tokenizer.tokenize(text)
 
 
     def _index(self, words):
@@ -39,5 +142,4 @@ class SifEmbedder(object):
             index = self._words.get(word, -1)
             if index >= 0:
                 word_indices.append(index)
-        return numpy.array(word_indices)
-
+        return np.array(word_indices)
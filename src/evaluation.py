@@ -25,6 +25,11 @@ class Evaluator(object):
 
         # return template.format()
 
+    @property
+    def scores(self):
+        # Accuracy, precision, recall, F1 and time of every fold
+        return self._scores
+
     def begin(self):
         self._previous_time = self._begin_time = datetime.datetime.now()
 
@@ -35,9 +40,13 @@ class Evaluator(object):
         return " ".join(map(lambda score: "{0:.2f}".format(round(score,2)),
                             scores))
 
-    def evaluate(self, Y_true, Y_pred, average = "weighted", normalize = True):
+    def evaluate(self, Y_true, Y_pred, average = "weighted", normalize = True,
+                 elapsed = None):
+        # elapsed is the time in seconds the fold took to fit and predict;
+        # by default the time since the previous fold is taken
         current_time = datetime.datetime.now()
-        training_time = current_time - self._previous_time
+        if elapsed is None:
+            elapsed = (current_time - self._previous_time).total_seconds()
         self._previous_time = current_time
         self._scores[self._split_index, 0] = accuracy_score(Y_true,
                                                             Y_pred,
@@ -52,7 +61,7 @@ class Evaluator(object):
                                                       Y_pred,
                                                       average = "weighted")
 
-        self._scores[self._split_index, 4] = training_time.total_seconds()
+        self._scores[self._split_index, 4] = elapsed
 
         print(self.format_score(self._scores[self._split_index,:]), end = " Seconds\n")
 
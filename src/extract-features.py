@@ -1,155 +1,116 @@
+import collections
+import concurrent.futures
 import numpy as np
 import pandas as pd
 import progressbar
-from collections import Counter
-from functools import reduce
+import os
 from sklearn.decomposition import TruncatedSVD
-import pickle
+import scipy.sparse
+import ngram
 import utils
+import word_vectors
+from corpus import TokenCorpus
+from embed import (compute_word_weights,
+                   compute_sif_embedding_with_pc,
+                   remove_principal_component)
+from feature_cache import FeatureCache
 import argparse
+import featurizer
+import threading
 
 
-def compute_ngram_embedding(tweet_text_body_tokens, n, dim):
-    X_ngram = np.zeros((len(tweet_text_body_tokens), dim))
-    row_index = 0
-
-    def update_ngram_embedding(row_index):
-        tokens = tweet_text_body_tokens[row_index]
-        l = len(tokens)
-        for i in range(l - (n - 1)):
-            col_index = hash("".join(tokens[i:i+n])) % dim
-            X_ngram[row_index, col_index] += 1
-
-    row_count = len(tweet_text_body_tokens)
-    update_ngram_embedding_with_progress = with_progress(
-        update_ngram_embedding,
-        row_count,
-        prefix = "{n}-gram ".format(n = n))
-
-    for row_index in range(row_count):
-        update_ngram_embedding_with_progress(row_index)
-
-    return X_ngram
-
-
-def compute_linguistic_features(tweet_text_body):
-    n = len(tweet_text_body)
-    mapper = tweet_text_body.map
-    return np.array([
-        mapper(with_progress(utils.avg_chars_per_word, n, prefix = "Avg. Chars ")),
-        mapper(with_progress(utils.avg_words_per_sentence, n, prefix = "Avg. Words ")),
-        mapper(with_progress(utils.num_of_chars, n, prefix = "Num. Chars ")),
-        mapper(with_progress(utils.num_of_punctutations, n, prefix = "Num. Puncts "))
-    ]).transpose()
-
-
-def with_progress(fun, max_value, increment = 5000, prefix = ""):
-    bar = progressbar.ProgressBar(max_value = max_value, prefix = prefix)
-    i = 0
-
-    def apply_and_update(*args, **kwargs):
-        nonlocal i
-        res = fun(*args, **kwargs)
-        i = i + 1
-        if i % increment == 0:
-            bar.update(i)
-        elif i == max_value:
-            bar.finish()
-        return res
-
-    return apply_and_update
-
-
-def tokenize_strings(tweet_text_body):
-    def tokenize(text):
-        words = []
-        word = ""
-        for c in text:
-            if c.isalpha():
-                word += c
-            else:
-                words.append(word)
-                word = ""
-                if not c.isspace():
-                    words.append(c)
-                    words.append(word)
-        return list(filter(lambda word: len(word) > 0, words))
-
-    n = len(tweet_text_body)
-
-    return list(map(with_progress(tokenize, n, prefix = "Tokenizing "),
-                    tweet_text_body))
-
-
-def compute_word_weights(tweet_text_body_tokens, a = 10e-3):
-    def update_counter(counter, values):
-        counter.update(values)
-        return counter
-    n = len(tweet_text_body_tokens)
-    word_weight_mapping = reduce(with_progress(update_counter, n, prefix = "Weighing "),
-                                 tweet_text_body_tokens,
-                                 Counter())
-    unique_word_count = sum(word_weight_mapping.values())
-    for key, value in word_weight_mapping.items():
-        frequency = value / unique_word_count
-        word_weight_mapping[key] = a / (a + frequency)
-    return word_weight_mapping
-
-def index(words,
-          word_index_mapping,
-          word_weight_mapping):
-    word_indices = []
-    word_weights = []
-    for word in words:
-        index = word_index_mapping.get(word, -1)
-        weight = word_weight_mapping.get(word, -1)
-        if index >= 0:
-            word_indices.append(index)
-            word_weights.append(weight)
-    return (np.array(word_indices),
-            np.array(word_weights))
-
-
-def compute_sif_embedding_with_pc(tweet_text_body_tokens,
-                                  word_weight_mapping,
-                                  word_index_mapping,
-                                  word_vector_mapping):
-
-    dims = (len(tweet_text_body_tokens), word_vector_mapping.shape[1])
-    sif_with_pc = np.zeros(dims)
-
-    def embed(row_index):
-        words = tweet_text_body_tokens[row_index]
-        (word_indices, word_weights) = index(words,
-                                             word_index_mapping,
-                                             word_weight_mapping)
-        if len(word_indices) == 0:
-            embedding_with_pc = np.zeros(word_vector_mapping.shape[1])
-        else:
-            embedding_with_pc = np.sum(word_vector_mapping[word_indices, :] *
-                                       word_weights[:, np.newaxis] /
-                                       len(word_weights),
-                                       axis = 0)
-        sif_with_pc[row_index,:] = embedding_with_pc
-
-
-    embed_with_progress = with_progress(embed, dims[0], prefix = "Embedding ")
-
-    for row_index in range(len(tweet_text_body_tokens)):
-        embed_with_progress(row_index)
-
-    return sif_with_pc
-
-
-def compute_sif_embedding_without_pc(embedding_with_pc):
-    # compute the principal component
+def compute_principal_component(embedding_with_pc):
     svd = TruncatedSVD(n_components = 1, n_iter = 7, random_state = 0)
     svd.fit(embedding_with_pc)
-    pc = svd.components_
+    return svd.components_
 
-    embedding_without_pc = (embedding_with_pc -
-                            embedding_with_pc.dot(pc.transpose()) * pc)
-    return embedding_without_pc
+
+def compute_sif_embedding_without_pc(embedding_with_pc):
+    pc = compute_principal_component(embedding_with_pc)
+    return remove_principal_component(embedding_with_pc, pc)
+
+
+def compute_principal_component_out_of_core(embedding_with_pc,
+                                            chunk_size = 100000,
+                                            max_iter = 200,
+                                            tol = 1e-10,
+                                            random_state = 0):
+    # Power iteration for the first right singular vector (which is what
+    # TruncatedSVD computes), reading the embedding one chunk of rows at a
+    # time, so that it can be memory-mapped.
+    row_count, col_count = embedding_with_pc.shape
+    pc = np.random.RandomState(random_state).normal(size = col_count)
+    pc /= np.linalg.norm(pc)
+
+    for _ in range(max_iter):
+        next_pc = np.zeros(col_count)
+        for start in range(0, row_count, chunk_size):
+            chunk = np.asarray(embedding_with_pc[start:start + chunk_size],
+                               dtype = np.float64)
+            next_pc += chunk.T.dot(chunk.dot(pc))
+        norm = np.linalg.norm(next_pc)
+        if norm == 0:
+            break
+        next_pc /= norm
+        converged = np.linalg.norm(next_pc - np.sign(next_pc.dot(pc)) * pc) < tol
+        pc = next_pc
+        if converged:
+            break
+
+    return pc[np.newaxis, :]
+
+
+def remove_principal_component_out_of_core(embedding_with_pc, pc, out, chunk_size = 100000):
+    for start in range(0, embedding_with_pc.shape[0], chunk_size):
+        end = min(start + chunk_size, embedding_with_pc.shape[0])
+        out[start:end] = remove_principal_component(
+            np.asarray(embedding_with_pc[start:end], dtype = np.float64), pc)
+    return out
+
+
+def open_feature_memmap(filepath, shape):
+    return np.lib.format.open_memmap(filepath,
+                                     mode = "w+",
+                                     dtype = np.float64,
+                                     shape = shape)
+
+
+def save_feature(filepath, X):
+    # Out-of-core feature sets are written in place into a memory-mapped
+    # npy file at their output filepath. Feature sets written to an npz
+    # file are stored as a sparse matrix. The same feature set saved in the
+    # other format is removed, so that it cannot be trained on by mistake.
+    stem, extension = os.path.splitext(filepath)
+    other_filepath = stem + (".npy" if extension == ".npz" else ".npz")
+    if extension in (".npy", ".npz") and os.path.exists(other_filepath):
+        os.remove(other_filepath)
+    if isinstance(X, np.memmap):
+        X.flush()
+    elif utils.is_sparse_file(filepath):
+        scipy.sparse.save_npz(filepath, scipy.sparse.csr_matrix(X))
+    else:
+        np.save(filepath, X)
+
+
+def compute_word_weight_drift(words, word_weights, previous_words, previous_word_weights):
+    # Largest change of the weight of any word between two corpora; a word
+    # missing from a corpus has frequency 0, hence weight 1.
+    previous_word_weight_mapping = dict(zip(previous_words, previous_word_weights))
+    previous_word_weights_by_id = np.fromiter(
+        (previous_word_weight_mapping.pop(word, 1.0) for word in words),
+        dtype = np.float64,
+        count = len(words))
+    drift = np.abs(word_weights - previous_word_weights_by_id).max(initial = 0.0)
+    removed_word_weights = np.fromiter(previous_word_weight_mapping.values(),
+                                       dtype = np.float64)
+    return max(drift, np.abs(removed_word_weights - 1.0).max(initial = 0.0))
+
+
+def compute_principal_component_drift(pc, previous_pc):
+    # 1 - |cos| of the angle between the components, whose sign is arbitrary
+    cosine = np.abs(np.dot(pc.ravel(), previous_pc.ravel()) /
+                    (np.linalg.norm(pc) * np.linalg.norm(previous_pc)))
+    return max(0.0, 1.0 - cosine)
 
 
 def parse_arguments():
@@ -163,11 +124,11 @@ def parse_arguments():
     parser.add_argument('processed_words_filepath',
                         metavar = 'processed-words-filepath',
                         type = str,
-                        help = "pickle file containing word to index mapping")
+                        help = "text file containing one word per line, in index order")
     parser.add_argument('processed_vectors_filepath',
                         metavar = 'processed-vectors-filepath',
                         type = str,
-                        help = "npz file containing embedding of words by their index")
+                        help = "npy file containing embedding of words by their index")
     parser.add_argument('y_filepath',
                         metavar = 'processed-vectors-filepath',
                         type = str,
@@ -175,11 +136,11 @@ def parse_arguments():
     parser.add_argument("x_bigram_filepath",
                         metavar = "x-bigram-filepath",
                         type = str,
-                        help = "npy file containing bigram representation")
+                        help = "npy (dense) or npz (sparse) file containing bigram representation")
     parser.add_argument("x_trigram_filepath",
                         metavar = "x-trigram-filepath",
                         type = str,
-                        help = "npy file containing trigram representation")
+                        help = "npy (dense) or npz (sparse) file containing trigram representation")
     parser.add_argument("x_sif_with_pc_filepath",
                         metavar = "x-sif-wih-pc-filepath",
                         type = str,
@@ -192,44 +153,375 @@ def parse_arguments():
                         metavar = "x-linguistic-feature-filepath",
                         type = str,
                         help = "npy file containing linguistic feature representation")
+    parser.add_argument("--worker-count",
+                        type = int,
+                        default = 1,
+                        help = "number of processes tokenizing the tweets in parallel")
+    parser.add_argument("--ngram-dimension",
+                        type = int,
+                        default = 300,
+                        help = "number of columns the n-grams are hashed into")
+    parser.add_argument("--word-vector-cache-dirpath",
+                        type = str,
+                        default = None,
+                        help = "directory caching the word vectors of the words in the tweets")
+    parser.add_argument("--feature-sets",
+                        type = str,
+                        nargs = "+",
+                        choices = [feature_set.name for feature_set in FEATURE_SETS],
+                        default = [feature_set.name for feature_set in FEATURE_SETS],
+                        help = "feature sets to compute (all of them by default)")
+    parser.add_argument("--feature-set-worker-count",
+                        type = int,
+                        default = 1,
+                        help = "number of feature sets computed concurrently")
+    parser.add_argument("--out-of-core",
+                        action = "store_true",
+                        help = ("compute the SIF features chunk by chunk into " +
+                                "memory-mapped output files"))
+    parser.add_argument("--chunk-size",
+                        type = int,
+                        default = 100000,
+                        help = "number of rows per chunk of the out-of-core computations")
+    parser.add_argument("--sif-pc-filepath",
+                        type = str,
+                        default = None,
+                        help = "npy file containing the principal component removed from the SIF embedding")
+    parser.add_argument("--feature-cache-dirpath",
+                        type = str,
+                        default = None,
+                        help = ("directory caching the features by tweet id, " +
+                                "so that only the features of new tweets are computed"))
+    parser.add_argument("--sif-tolerance",
+                        type = float,
+                        default = 0.0,
+                        help = ("largest change of the SIF word weights and principal " +
+                                "component for which cached SIF features are reused"))
+    parser.add_argument("--featurizer-dirpath",
+                        type = str,
+                        default = None,
+                        help = ("directory saving the state needed to featurize new tweets " +
+                                "the way these were (n-gram dimension, SIF word weights, " +
+                                "word vectors and principal component)"))
 
     return parser.parse_args()
 
 
-def main():
-    args = parse_arguments()
-
-    tweets = pd.read_pickle(args.processed_tweets_filepath)
-
-    np.save(args.y_filepath, tweets.user_id)
-
-    tweet_text_body_tokens = tokenize_strings(tweets.text_body)
-
-    word_weight_mapping = compute_word_weights(tweets.text_body)
-
-    X_bigram = compute_ngram_embedding(tweet_text_body_tokens, 2, 300)
-    np.save(args.x_bigram_filepath, X_bigram)
-
-    X_trigram = compute_ngram_embedding(tweet_text_body_tokens, 3, 300)
-    np.save(args.x_trigram_filepath, X_trigram)
-
-    word_index_mapping = pickle.load(open(args.processed_words_filepath, "rb"))
+class FeatureExtractor(object):
+    # Computes the inputs the feature sets depend upon on first use, so
+    # that, for instance, word vectors are only loaded when a SIF feature set
+    # is requested. Inputs and feature sets may be requested concurrently.
+
+    def __init__(self, args, tweets):
+        self._args = args
+        self._tweets = tweets
+        self._cache = (None if args.feature_cache_dirpath is None
+                       else FeatureCache(args.feature_cache_dirpath))
+        self._values = {}
+        self._locks = collections.defaultdict(threading.Lock)
+        self._locks_lock = threading.Lock()
+        self._features = {}
+
+    @property
+    def args(self):
+        return self._args
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def texts(self):
+        return self._tweets.text_body.values
+
+    def ids(self):
+        return self._tweets.id.values
+
+    def _get(self, name, compute):
+        with self._locks_lock:
+            lock = self._locks[name]
+        with lock:
+            if name not in self._values:
+                self._values[name] = compute()
+            return self._values[name]
+
+    def corpus(self):
+        return self._get("corpus",
+                         lambda: TokenCorpus.from_texts(self.texts(),
+                                                        worker_count = self._args.worker_count))
+
+    def word_weights(self):
+        return self._get("word_weights",
+                         lambda: compute_word_weights(self.corpus()))
+
+    def word_vectors(self):
+        return self._get("word_vectors",
+                         lambda: load_word_vectors(self._args, self.corpus()))
+
+    def principal_component(self):
+        return self._get("principal_component",
+                         lambda: compute_sif_principal_component(self))
+
+    def set_feature(self, name, future):
+        self._features[name] = future
+
+    def feature(self, name):
+        return self._features[name].result()
+
+    def rows(self, name, compute, parameters = None, out = None):
+        # The feature rows of all the tweets. compute(rows) computes the
+        # rows at the given positions; with a feature cache, it is only
+        # called for the tweets that are not cached yet. With out, the rows
+        # are computed chunk by chunk into it.
+        if self._cache is None:
+            if out is None:
+                return compute(np.arange(len(self._tweets)))
+            for start in range(0, len(self._tweets), self._args.chunk_size):
+                rows = np.arange(start, min(start + self._args.chunk_size, len(self._tweets)))
+                out[rows] = compute(rows)
+            return out
+        return self._cache.update(name, self.ids(), compute, parameters,
+                                  out = out,
+                                  chunk_size = self._args.chunk_size)
+
+
+def load_word_vectors(args, corpus):
+    vocabulary = set(corpus.vocabulary)
+
+    if args.word_vector_cache_dirpath is None:
+        word_index_mapping = word_vectors.read_word_index(args.processed_words_filepath,
+                                                          vocabulary = vocabulary)
+        word_vector_mapping = word_vectors.load_word_vectors(args.processed_vectors_filepath)
+    else:
+        word_index_mapping, word_vector_mapping = word_vectors.load_pruned_word_vectors(
+            args.processed_words_filepath,
+            args.processed_vectors_filepath,
+            vocabulary,
+            args.word_vector_cache_dirpath)
+
+    return word_index_mapping, word_vector_mapping
+
+
+def extract_ngram_feature(name, n, filepath_argument):
+    # The n-grams stay sparse when they are written to an npz file
+    def extract(extractor):
+        corpus = extractor.corpus()
+        dim = extractor.args.ngram_dimension
+        sparse = utils.is_sparse_file(getattr(extractor.args, filepath_argument))
+
+        def compute(rows):
+            X = ngram.compute_hashed_ngram_embedding(corpus.take(rows), (n, n), dim)
+            return X if sparse else X.toarray()
+
+        return extractor.rows(name,
+                              compute,
+                              {"ngram_dimension": dim, "sparse": sparse})
+    return extract
+
+
+def extract_sif_with_pc_feature(extractor):
+    corpus = extractor.corpus()
+    word_weights = extractor.word_weights()
+    cache = extractor.cache
+    tolerance = extractor.args.sif_tolerance
+
+    # The SIF embedding of a tweet depends on the word weights of the whole
+    # corpus. The weights the cached rows were computed with are kept, and
+    # once the current weights drift away from them by more than the
+    # tolerance, all the rows are recomputed.
+    if cache is not None:
+        statistics = cache.load_statistics("X-SIF-with-PC")
+        if statistics is not None:
+            word_weight_drift = compute_word_weight_drift(corpus.vocabulary,
+                                                          word_weights,
+                                                          statistics["words"],
+                                                          statistics["word_weights"])
+            print(f"SIF word weight drift: {word_weight_drift} " +
+                  f"(tolerance {tolerance})")
+        if statistics is None or word_weight_drift > tolerance:
+            print("Recomputing the SIF embedding of all tweets")
+            cache.clear("X-SIF-with-PC")
+            cache.save_statistics("X-SIF-with-PC",
+                                  words = np.array(corpus.vocabulary, dtype = str),
+                                  word_weights = word_weights)
+
+    def compute(rows):
+        word_index_mapping, word_vector_mapping = extractor.word_vectors()
+        return compute_sif_embedding_with_pc(corpus.take(rows),
+                                             word_weights,
+                                             word_index_mapping,
+                                             word_vector_mapping)
+
+    sif_parameters = {"word_vectors": word_vectors.fingerprint_word_vectors(
+        extractor.args.processed_words_filepath,
+        extractor.args.processed_vectors_filepath)}
+
+    # Out of core, cached or not, the rows are written chunk by chunk into
+    # the memory-mapped output file
+    out = None
+    if extractor.args.out_of_core:
+        dim = word_vectors.load_word_vectors(extractor.args.processed_vectors_filepath).shape[1]
+        out = open_feature_memmap(extractor.args.x_sif_with_pc_filepath, (len(corpus), dim))
+
+    return extractor.rows("X-SIF-with-PC", compute, sif_parameters, out)
+
+
+def compute_sif_principal_component(extractor):
+    args = extractor.args
+    X_sif_with_pc = extractor.feature("X-SIF-with-PC")
+    if args.out_of_core:
+        pc = compute_principal_component_out_of_core(X_sif_with_pc,
+                                                     chunk_size = args.chunk_size)
+    else:
+        pc = compute_principal_component(X_sif_with_pc)
+
+    # The principal component is recomputed every time (which is cheap
+    # compared to the embedding), but the cached one is kept as long as
+    # the new one stays within the tolerance.
+    cache = extractor.cache
+    if cache is not None:
+        statistics = cache.load_statistics("X-SIF-without-PC")
+        if statistics is not None:
+            pc_drift = compute_principal_component_drift(pc, statistics["pc"])
+            print(f"SIF principal component drift: {pc_drift} " +
+                  f"(tolerance {extractor.args.sif_tolerance})")
+            if pc_drift <= extractor.args.sif_tolerance:
+                pc = statistics["pc"]
+        cache.save_statistics("X-SIF-without-PC", pc = pc)
+
+    # The component is needed to embed new tweets the same way
+    if args.sif_pc_filepath is not None:
+        np.save(args.sif_pc_filepath, pc)
+
+    return pc
+
+
+def extract_sif_without_pc_feature(extractor):
+    args = extractor.args
+    X_sif_with_pc = extractor.feature("X-SIF-with-PC")
+    pc = extractor.principal_component()
+
+    if args.out_of_core:
+        return remove_principal_component_out_of_core(
+            X_sif_with_pc,
+            pc,
+            open_feature_memmap(args.x_sif_without_pc_filepath, X_sif_with_pc.shape),
+            chunk_size = args.chunk_size)
+
+    return remove_principal_component(X_sif_with_pc, pc)
+
+
+def extract_linguistic_feature(extractor):
+    texts = extractor.texts()
+    return extractor.rows(
+        "X-linguistic-feature",
+        lambda rows: utils.compute_linguistic_features(texts[rows]))
+
+
+# Every feature set, in dependency order, with the inputs it needs (the
+# tokenized corpus, the SIF word weights, the word vectors or other
+# feature sets) and the argument naming its output file.
+FeatureSet = collections.namedtuple("FeatureSet",
+                                    ["name", "inputs", "extract", "filepath_argument"])
+
+FEATURE_SETS = [
+    FeatureSet("X-bigram",
+               ["corpus"],
+               extract_ngram_feature("X-bigram", 2, "x_bigram_filepath"),
+               "x_bigram_filepath"),
+    FeatureSet("X-trigram",
+               ["corpus"],
+               extract_ngram_feature("X-trigram", 3, "x_trigram_filepath"),
+               "x_trigram_filepath"),
+    FeatureSet("X-SIF-with-PC",
+               ["corpus", "word_weights", "word_vectors"],
+               extract_sif_with_pc_feature,
+               "x_sif_with_pc_filepath"),
+    FeatureSet("X-SIF-without-PC",
+               ["X-SIF-with-PC"],
+               extract_sif_without_pc_feature,
+               "x_sif_without_pc_filepath"),
+    FeatureSet("X-linguistic-feature",
+               ["texts"],
+               extract_linguistic_feature,
+               "x_linguistic_feature_filepath")
+]
+
+
+def select_feature_sets(names):
+    # The requested feature sets along with the feature sets they depend
+    # upon, in dependency order
+    feature_set_mapping = {feature_set.name: feature_set for feature_set in FEATURE_SETS}
+    selected = set()
+
+    def select(name):
+        if name not in selected:
+            selected.add(name)
+            for dependency in feature_set_mapping[name].inputs:
+                if dependency in feature_set_mapping:
+                    select(dependency)
+
+    for name in names:
+        select(name)
+    return [feature_set for feature_set in FEATURE_SETS if feature_set.name in selected]
+
+
+def save_featurizer(extractor, dirpath, feature_set_names):
+    # The SIF state is only saved when the SIF features were extracted;
+    # otherwise the featurizer keeps the one it has
+    if "X-SIF-with-PC" not in feature_set_names:
+        featurizer.save_featurizer(dirpath, extractor.args.ngram_dimension)
+        return
+
+    word_index_mapping, word_vector_mapping = extractor.word_vectors()
+    featurizer.save_featurizer(dirpath,
+                               extractor.args.ngram_dimension,
+                               extractor.corpus().vocabulary,
+                               extractor.word_weights(),
+                               word_index_mapping,
+                               word_vector_mapping,
+                               extractor.principal_component())
+
+
+def extract_features(args, tweets):
+    extractor = FeatureExtractor(args, tweets)
+    requested = set(args.feature_sets)
+    feature_sets = select_feature_sets(args.feature_sets)
+
+    print("Extracting:", ", ".join(feature_set.name for feature_set in feature_sets))
+
+    def extract(feature_set):
+        X = feature_set.extract(extractor)
+        if feature_set.name in requested:
+            save_feature(getattr(args, feature_set.filepath_argument), X)
+        return X
+
+    # Feature sets are submitted in dependency order, so a feature set
+    # waiting for another never holds up the one it waits for.
+    with concurrent.futures.ThreadPoolExecutor(args.feature_set_worker_count) as executor:
+        for feature_set in feature_sets:
+            extractor.set_feature(feature_set.name, executor.submit(extract, feature_set))
+        for feature_set in feature_sets:
+            extractor.feature(feature_set.name)
+
+    if args.featurizer_dirpath is not None:
+        save_featurizer(extractor,
+                        args.featurizer_dirpath,
+                        [feature_set.name for feature_set in feature_sets])
 
-    word_vector_mapping = np.load(args.processed_vectors_filepath)
 
-    X_sif_with_pc = compute_sif_embedding_with_pc(tweet_text_body_tokens,
-                                                  word_weight_mapping,
-                                                  word_index_mapping,
-                                                  word_vector_mapping)
+def main():
+    args = parse_arguments()
 
-    np.save(args.x_sif_with_pc_filepath, X_sif_with_pc)
+    columns = ["user_id", "text_body"]
+    if args.feature_cache_dirpath is not None:
+        columns.append("id")
 
-    X_sif_without_pc = compute_sif_embedding_without_pc(X_sif_with_pc)
+    tweets = utils.read_data_from_file(args.processed_tweets_filepath,
+                                       columns = columns)
 
-    np.save(args.x_sif_without_pc_filepath, X_sif_without_pc)
+    np.save(args.y_filepath, tweets.user_id)
 
-    np.save(args.x_linguistic_feature_filepath,
-            compute_linguistic_features(tweets.text_body))
+    extract_features(args, tweets)
 
 
 if __name__ =="__main__":
@@ -0,0 +1,234 @@
+import json
+import numpy as np
+import os
+import scipy.sparse
+import shutil
+
+# Feature rows cached by tweet id, so that only the features of new tweets
+# have to be computed.
+#
+# Every feature set has its own directory holding a manifest and a list of
+# blocks; each block is a pair of npy files with the ids of its tweets and
+# their feature rows (an npz file when the rows are a sparse matrix).
+# Every run appends at most one block. Rows of tweets
+# that are no longer in the data are dropped when too many of them pile up.
+# Dense feature sets can also be updated out of core, straight into a
+# memory-mapped output, without ever holding all the rows in memory.
+
+
+def load_rows(filepath):
+    if filepath.endswith(".npz"):
+        return scipy.sparse.load_npz(filepath).tocsr()
+    return np.load(filepath)
+
+
+def save_rows(filepath, X):
+    if scipy.sparse.issparse(X):
+        scipy.sparse.save_npz(filepath, X.tocsr())
+    else:
+        np.save(filepath, X)
+
+
+def concatenate_rows(Xs):
+    if scipy.sparse.issparse(Xs[0]):
+        return scipy.sparse.vstack(Xs, format = "csr")
+    return np.concatenate(Xs)
+
+
+def copy_rows(X_filepath, X_ids, ids, out, chunk_size):
+    # Copies the rows of the npy file X_filepath, which hold the features
+    # of X_ids, into the rows of out of the same ids in ids; the ids
+    # missing from X_ids are left alone. The file is memory-mapped and
+    # read chunk_size rows at a time.
+    if len(X_ids) == 0:
+        return
+    X = np.load(X_filepath, mmap_mode = "r")
+    order = np.argsort(X_ids)
+    positions = np.searchsorted(X_ids, ids, sorter = order)
+    positions[positions == len(X_ids)] = 0
+    found = np.flatnonzero(X_ids[order[positions]] == ids)
+    sources = order[positions[found]]
+    for start in range(0, len(found), chunk_size):
+        out[found[start:start + chunk_size]] = X[sources[start:start + chunk_size]]
+
+
+class FeatureCache(object):
+    def __init__(self, dirpath, compaction_ratio = 0.5):
+        self._dirpath = dirpath
+        self._compaction_ratio = compaction_ratio
+
+    def _feature_dirpath(self, name):
+        return os.path.join(self._dirpath, name)
+
+    def _manifest_filepath(self, name):
+        return os.path.join(self._feature_dirpath(name), "manifest.json")
+
+    def _statistics_filepath(self, name):
+        return os.path.join(self._dirpath, name + ".statistics.npz")
+
+    def _read_manifest(self, name):
+        try:
+            with open(self._manifest_filepath(name), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, name, manifest):
+        temporary_filepath = self._manifest_filepath(name) + ".tmp"
+        with open(temporary_filepath, "w") as f:
+            json.dump(manifest, f, indent = 2)
+        os.replace(temporary_filepath, self._manifest_filepath(name))
+
+    def clear(self, name):
+        shutil.rmtree(self._feature_dirpath(name), ignore_errors = True)
+
+    def load(self, name):
+        # Returns the ids and feature rows of all the blocks
+        manifest = self._read_manifest(name)
+        blocks = [] if manifest is None else manifest["blocks"]
+        if len(blocks) == 0:
+            return np.zeros(0, dtype = np.int64), None
+        dirpath = self._feature_dirpath(name)
+        ids = np.concatenate([np.load(os.path.join(dirpath, block["ids"]))
+                              for block in blocks])
+        X = concatenate_rows([load_rows(os.path.join(dirpath, block["X"]))
+                              for block in blocks])
+        return ids, X
+
+    def _write_blocks(self, name, parameters, blocks, ids, X):
+        dirpath = self._feature_dirpath(name)
+        os.makedirs(dirpath, exist_ok = True)
+        block_index = max([block["index"] for block in blocks], default = -1) + 1
+        block = {"index": block_index,
+                 "ids": "ids-{0:05d}.npy".format(block_index),
+                 "X": "X-{0:05d}.{1}".format(block_index,
+                                             "npz" if scipy.sparse.issparse(X) else "npy")}
+        np.save(os.path.join(dirpath, block["ids"]), ids)
+        save_rows(os.path.join(dirpath, block["X"]), X)
+        self._write_manifest(name, {"parameters": parameters,
+                                    "blocks": blocks + [block]})
+
+    def _read_blocks(self, name, parameters):
+        manifest = self._read_manifest(name)
+        if manifest is not None and manifest["parameters"] != parameters:
+            print(f"{name}: parameters changed, recomputing all rows")
+            self.clear(name)
+            manifest = None
+        return [] if manifest is None else manifest["blocks"]
+
+    def update(self, name, ids, compute, parameters = None, out = None, chunk_size = 100000):
+        # Returns the feature rows of the given tweet ids, in order.
+        # compute(rows) is called with the positions (within ids) of the
+        # tweets whose features are not cached yet and must return their
+        # feature rows, including when there are none. Changing the
+        # parameters invalidates the cache.
+        # With out, a dense (len(ids) x dim) array such as a memory-mapped
+        # file, the rows are written into out and returned out of core.
+        if out is not None:
+            return self._update_out_of_core(name, ids, compute, parameters, out, chunk_size)
+
+        blocks = self._read_blocks(name, parameters)
+
+        cached_ids, cached_X = self.load(name)
+        new_rows = np.flatnonzero(~np.isin(ids, cached_ids))
+        removed_count = np.count_nonzero(~np.isin(cached_ids, ids))
+
+        print(f"{name}: {len(ids) - len(new_rows)} cached, " +
+              f"{len(new_rows)} new, {removed_count} removed rows")
+
+        new_ids = ids[new_rows]
+        new_X = compute(new_rows) if len(new_rows) > 0 else None
+        if cached_X is not None and removed_count > self._compaction_ratio * len(cached_ids):
+            # Rewrite the cache as a single block without removed rows,
+            # whether or not there are new rows
+            kept = np.isin(cached_ids, ids)
+            new_ids = np.concatenate([cached_ids[kept], new_ids])
+            new_X = cached_X[kept] if new_X is None else concatenate_rows([cached_X[kept], new_X])
+            self.clear(name)
+            blocks = []
+        if new_X is not None:
+            self._write_blocks(name, parameters, blocks, new_ids, new_X)
+            cached_ids, cached_X = self.load(name)
+
+        if cached_X is None:
+            # Nothing cached and no ids: compute gives the empty rows their
+            # width and type
+            return compute(np.zeros(0, dtype = np.int64))
+        positions = np.argsort(cached_ids)
+        return cached_X[positions[np.searchsorted(cached_ids, ids, sorter = positions)]]
+
+    def _update_out_of_core(self, name, ids, compute, parameters, out, chunk_size):
+        # compute is called with at most chunk_size rows at a time and the
+        # new block is a memory-mapped file filled chunk by chunk. The
+        # blocks are then copied into out one at a time, memory-mapped.
+        blocks = self._read_blocks(name, parameters)
+        dirpath = self._feature_dirpath(name)
+        block_ids = [np.load(os.path.join(dirpath, block["ids"])) for block in blocks]
+        cached_ids = (np.concatenate(block_ids) if len(blocks) > 0
+                      else np.zeros(0, dtype = np.int64))
+        new_rows = np.flatnonzero(~np.isin(ids, cached_ids))
+        removed_count = np.count_nonzero(~np.isin(cached_ids, ids))
+
+        print(f"{name}: {len(ids) - len(new_rows)} cached, " +
+              f"{len(new_rows)} new, {removed_count} removed rows")
+
+        compact = len(blocks) > 0 and removed_count > self._compaction_ratio * len(cached_ids)
+        if len(new_rows) > 0 or compact:
+            # When compacting, the new block starts with the kept rows of
+            # the old blocks, which are deleted once it is written
+            kept_ids = [current_ids[np.isin(current_ids, ids)]
+                        for current_ids in block_ids] if compact else []
+            new_ids = np.concatenate(kept_ids + [ids[new_rows]])
+
+            os.makedirs(dirpath, exist_ok = True)
+            block_index = max([block["index"] for block in blocks], default = -1) + 1
+            block = {"index": block_index,
+                     "ids": "ids-{0:05d}.npy".format(block_index),
+                     "X": "X-{0:05d}.npy".format(block_index)}
+            X = np.lib.format.open_memmap(os.path.join(dirpath, block["X"]),
+                                          mode = "w+",
+                                          dtype = out.dtype,
+                                          shape = (len(new_ids), out.shape[1]))
+            offset = 0
+            for old_block, current_ids, current_kept_ids in zip(blocks, block_ids, kept_ids):
+                copy_rows(os.path.join(dirpath, old_block["X"]),
+                          current_ids,
+                          current_kept_ids,
+                          X[offset:offset + len(current_kept_ids)],
+                          chunk_size)
+                offset += len(current_kept_ids)
+            for start in range(0, len(new_rows), chunk_size):
+                chunk = new_rows[start:start + chunk_size]
+                X[offset:offset + len(chunk)] = compute(chunk)
+                offset += len(chunk)
+            X.flush()
+            del X
+            np.save(os.path.join(dirpath, block["ids"]), new_ids)
+
+            if compact:
+                self._write_manifest(name, {"parameters": parameters, "blocks": [block]})
+                for old_block in blocks:
+                    os.remove(os.path.join(dirpath, old_block["ids"]))
+                    os.remove(os.path.join(dirpath, old_block["X"]))
+                blocks, block_ids = [block], [new_ids]
+            else:
+                self._write_manifest(name, {"parameters": parameters, "blocks": blocks + [block]})
+                blocks, block_ids = blocks + [block], block_ids + [new_ids]
+
+        for block, current_ids in zip(blocks, block_ids):
+            copy_rows(os.path.join(dirpath, block["X"]), current_ids, ids, out, chunk_size)
+        return out
+
+    def load_statistics(self, name):
+        # Corpus level statistics the cached features of a feature set
+        # depend upon, as a dict of arrays
+        try:
+            with np.load(self._statistics_filepath(name)) as statistics:
+                return dict(statistics)
+        except FileNotFoundError:
+            return None
+
+    def save_statistics(self, name, **statistics):
+        os.makedirs(self._dirpath, exist_ok = True)
+        with open(self._statistics_filepath(name), "wb") as f:
+            np.savez(f, **statistics)
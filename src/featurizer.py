@@ -0,0 +1,250 @@
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+from sklearn.utils import murmurhash3_32
+import ngram
+import tokenizer
+import utils
+from corpus import TokenCorpus
+from embed import SifEmbedder
+
+# The state needed to featurize new tweets the way extract-features.py
+# featurized the training tweets. Every save writes a new version-<n>
+# subdirectory of the featurizer directory and then points the file
+# current at it with a single os.replace, so a reader always finds a
+# complete featurizer. Each version holds:
+#
+#   manifest.json             version, n-gram dimension, array shapes
+#   word-hashes.npy           sorted 64 bit hashes of the words with a vector
+#   vector-indices.npy        row of vectors.npy of every hashed word
+#   word-weights.npy          SIF weight of every hashed word
+#   vectors.npy               vectors of these words, in word vector store order
+#   principal-component.npy   component removed from the SIF embedding
+#
+# Words are looked up by hash with a binary search in the memory-mapped
+# arrays, so loading takes no time whatever the size of the vocabulary.
+# The SIF files are missing when the SIF features were not extracted.
+
+FEATURIZER_VERSION = 1
+
+HASH_SEEDS = (ngram.SEED, ngram.SEED + 1)
+
+SIF_FILENAMES = ["word-hashes.npy",
+                 "vector-indices.npy",
+                 "word-weights.npy",
+                 "vectors.npy",
+                 "principal-component.npy"]
+
+NGRAM_FEATURE_SETS = {"X-bigram": 2, "X-trigram": 3}
+
+FEATURE_SETS = ["X-bigram",
+                "X-trigram",
+                "X-SIF-with-PC",
+                "X-SIF-without-PC",
+                "X-linguistic-feature"]
+
+
+def hash_words(words):
+    # Two 32 bit MurmurHashes make a 64 bit hash, which, unlike a 32 bit
+    # one, does not collide within millions of words
+    hashes = np.fromiter((murmurhash3_32(word, seed = HASH_SEEDS[0], positive = True)
+                          for word in words),
+                         dtype = np.uint64,
+                         count = len(words))
+    hashes <<= np.uint64(32)
+    hashes |= np.fromiter((murmurhash3_32(word, seed = HASH_SEEDS[1], positive = True)
+                           for word in words),
+                          dtype = np.uint64,
+                          count = len(words))
+    return hashes
+
+
+class HashedWordMapping(object):
+    # A read-only mapping of words to values, looked up by the hash of the
+    # word in a sorted hash array
+
+    def __init__(self, hashes, values):
+        self._hashes = hashes
+        self._values = values
+
+    def lookup(self, words, default):
+        values = np.full(len(words), default, dtype = self._values.dtype)
+        if len(words) == 0 or len(self._hashes) == 0:
+            return values
+        hashes = hash_words(words)
+        positions = np.searchsorted(self._hashes, hashes)
+        positions[positions == len(self._hashes)] = 0
+        found = self._hashes[positions] == hashes
+        values[found] = self._values[positions[found]]
+        return values
+
+    def get(self, word, default = None):
+        return self.lookup([word], default)[0]
+
+
+def save_featurizer(dirpath,
+                    ngram_dimension,
+                    words = None,
+                    word_weights = None,
+                    word_index_mapping = None,
+                    word_vector_mapping = None,
+                    principal_component = None):
+    # words and word_weights are the vocabulary of the training tweets and
+    # the SIF weight of every word; only the words with a vector are kept.
+    # The featurizer replaces any previous one at once. Without words, the
+    # SIF state of the current featurizer is kept: nothing is saved when
+    # the n-gram dimension did not change, and the SIF files are copied to
+    # the new version otherwise.
+    manifest = {"version": FEATURIZER_VERSION,
+                "ngram_dimension": ngram_dimension,
+                "sif": words is not None}
+
+    os.makedirs(dirpath, exist_ok = True)
+    previous_version = read_current_version(dirpath)
+    previous_manifest = None
+    if words is None and previous_version is not None:
+        with open(os.path.join(dirpath, previous_version, "manifest.json"), "r") as f:
+            previous_manifest = json.load(f)
+        if previous_manifest["version"] != FEATURIZER_VERSION:
+            previous_manifest = None
+        elif previous_manifest["ngram_dimension"] == ngram_dimension:
+            return
+    # A version left incomplete by an interrupted save is never reused
+    version = "version-{0}".format(max(version_numbers(dirpath), default = 0) + 1)
+    version_dirpath = os.path.join(dirpath, version)
+    os.makedirs(version_dirpath)
+
+    if words is not None:
+        # Keeping the vectors in the order of the word vector store makes
+        # the embedding sum up the words of a tweet in the same order, hence
+        # give the very same features.
+        vector_positions = [(word_index_mapping[word], position)
+                            for position, word in enumerate(words)
+                            if word in word_index_mapping]
+        vector_positions.sort()
+        indices = np.array([index for index, _ in vector_positions], dtype = np.int64)
+        positions = np.array([position for _, position in vector_positions], dtype = np.int64)
+
+        hashes = hash_words([words[position] for position in positions])
+        order = np.argsort(hashes)
+        if np.any(hashes[order][1:] == hashes[order][:-1]):
+            raise ValueError("Word hash collision, the featurizer cannot be saved")
+
+        np.save(os.path.join(version_dirpath, "word-hashes.npy"), hashes[order])
+        np.save(os.path.join(version_dirpath, "vector-indices.npy"), order)
+        np.save(os.path.join(version_dirpath, "word-weights.npy"),
+                np.asarray(word_weights, dtype = np.float64)[positions[order]])
+        vectors = np.lib.format.open_memmap(os.path.join(version_dirpath, "vectors.npy"),
+                                            mode = "w+",
+                                            dtype = np.float64,
+                                            shape = (len(indices), word_vector_mapping.shape[1]))
+        vectors[:] = word_vector_mapping[indices]
+        vectors.flush()
+        del vectors
+        np.save(os.path.join(version_dirpath, "principal-component.npy"), principal_component)
+        manifest["word_count"] = len(indices)
+        manifest["dimension"] = word_vector_mapping.shape[1]
+    elif previous_manifest is not None and previous_manifest["sif"]:
+        for name in SIF_FILENAMES:
+            shutil.copyfile(os.path.join(dirpath, previous_version, name),
+                            os.path.join(version_dirpath, name))
+        manifest.update(sif = True,
+                        word_count = previous_manifest["word_count"],
+                        dimension = previous_manifest["dimension"])
+
+    with open(os.path.join(version_dirpath, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent = 2)
+
+    descriptor, temporary_filepath = tempfile.mkstemp(dir = dirpath, suffix = ".tmp")
+    with os.fdopen(descriptor, "w") as f:
+        f.write(version + "\n")
+    utils.set_default_permissions(temporary_filepath)
+    os.replace(temporary_filepath, os.path.join(dirpath, "current"))
+
+    # The previous version is kept for the readers that have just read the
+    # pointer to it; older versions are removed. Nothing else in dirpath
+    # is touched, as it may be shared with other files.
+    for number in version_numbers(dirpath):
+        name = "version-{0}".format(number)
+        if name not in (version, previous_version):
+            shutil.rmtree(os.path.join(dirpath, name), ignore_errors = True)
+
+
+def version_numbers(dirpath):
+    return [int(name[len("version-"):]) for name in os.listdir(dirpath)
+            if name.startswith("version-") and name[len("version-"):].isdigit() and
+            os.path.isdir(os.path.join(dirpath, name))]
+
+
+def read_current_version(dirpath):
+    # The name of the version subdirectory current points at, None when no
+    # featurizer was saved in dirpath
+    try:
+        with open(os.path.join(dirpath, "current"), "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+class Featurizer(object):
+    # Turns tweets into the features of any of the feature sets
+
+    def __init__(self, ngram_dimension,
+                 sif_with_pc_embedder = None,
+                 sif_without_pc_embedder = None):
+        self._ngram_dimension = ngram_dimension
+        self._sif_with_pc_embedder = sif_with_pc_embedder
+        self._sif_without_pc_embedder = sif_without_pc_embedder
+
+    @classmethod
+    def load(cls, dirpath):
+        version = read_current_version(dirpath)
+        if version is None:
+            raise FileNotFoundError("No featurizer saved in " + dirpath)
+        dirpath = os.path.join(dirpath, version)
+        with open(os.path.join(dirpath, "manifest.json"), "r") as f:
+            manifest = json.load(f)
+        if manifest["version"] != FEATURIZER_VERSION:
+            raise ValueError("Featurizer version {0} is not supported (expected {1})".format(
+                manifest["version"], FEATURIZER_VERSION))
+        if not manifest["sif"]:
+            return cls(manifest["ngram_dimension"])
+
+        def load_array(name):
+            return np.load(os.path.join(dirpath, name), mmap_mode = "r")
+
+        word_hashes = load_array("word-hashes.npy")
+        vector_index_mapping = HashedWordMapping(word_hashes, load_array("vector-indices.npy"))
+        word_weights = HashedWordMapping(word_hashes, load_array("word-weights.npy"))
+        vectors = load_array("vectors.npy")
+        return cls(manifest["ngram_dimension"],
+                   SifEmbedder(vector_index_mapping,
+                               vectors,
+                               word_weights = word_weights),
+                   SifEmbedder(vector_index_mapping,
+                               vectors,
+                               word_weights = word_weights,
+                               principal_component = np.load(
+                                   os.path.join(dirpath, "principal-component.npy"))))
+
+    def transform(self, texts, feature_set):
+        if feature_set == "X-linguistic-feature":
+            return utils.compute_linguistic_features(np.asarray(texts, dtype = object))
+
+        if feature_set in NGRAM_FEATURE_SETS:
+            n = NGRAM_FEATURE_SETS[feature_set]
+            corpus = TokenCorpus.from_tokens(map(tokenizer.tokenize, texts))
+            return ngram.compute_hashed_ngram_embedding(corpus,
+                                                        (n, n),
+                                                        self._ngram_dimension,
+                                                        progress = False)
+
+        if feature_set not in ("X-SIF-with-PC", "X-SIF-without-PC"):
+            raise ValueError("Unknown feature set: " + feature_set)
+        if self._sif_with_pc_embedder is None:
+            raise ValueError("The featurizer was saved without the SIF features")
+        if feature_set == "X-SIF-with-PC":
+            return self._sif_with_pc_embedder.embed_batch(texts)
+        return self._sif_without_pc_embedder.embed_batch(texts)
@@ -0,0 +1,147 @@
+import concurrent.futures
+import numpy as np
+import queue
+import scipy.sparse
+import sys
+import threading
+import time
+from featurizer import Featurizer
+from model_store import ModelStore, load_model
+from training import prepare_features
+
+# Author attribution of new tweets with a trained model.
+#
+# A Predictor pairs a model with the featurizer of the feature set it was
+# trained on. A MicroBatcher collects tweets submitted one at a time (from
+# any number of threads) into batches, so that featurization and
+# prediction run vectorized.
+
+class Predictor(object):
+    # N-gram features are densified unless sparse is set, which is what
+    # models trained on sparse (npz) n-gram features expect
+
+    def __init__(self, model, featurizer, feature_set, sparse = False):
+        self._model = model
+        self._featurizer = featurizer
+        self._feature_set = feature_set
+        self._sparse = sparse
+
+    @classmethod
+    def load(cls, model_filepath, featurizer_dirpath, feature_set, sparse = False):
+        return cls(load_model(model_filepath),
+                   Featurizer.load(featurizer_dirpath),
+                   feature_set,
+                   sparse)
+
+    @classmethod
+    def load_best(cls, model_dirpath, featurizer_dirpath, feature_set, score = "accuracy"):
+        # The best model trained on the feature set in the model store, as
+        # told by its index; only that model is loaded
+        store = ModelStore(model_dirpath)
+        entry = store.best(score, feature = feature_set)
+        print("Model:", entry["model_name"], "with", score, entry["scores"][score],
+              file = sys.stderr)
+        return cls(store.load(entry),
+                   Featurizer.load(featurizer_dirpath),
+                   feature_set,
+                   entry["sparse"])
+
+    def featurize(self, texts):
+        X = self._featurizer.transform(texts, self._feature_set)
+        if scipy.sparse.issparse(X) and not self._sparse:
+            X = X.toarray()
+        return prepare_features(self._model, X)
+
+    def predict(self, texts):
+        return self._model.predict(self.featurize(texts))
+
+    def predict_proba(self, texts):
+        # The classes and the probability of each of them for every tweet
+        return self._model.classes_, self._model.predict_proba(self.featurize(texts))
+
+    def predict_author(self, texts):
+        # The most likely author of every tweet, with its probability when
+        # the model estimates probabilities (None otherwise)
+        if len(texts) == 0:
+            return []
+        if not hasattr(self._model, "predict_proba"):
+            return [(author, None) for author in self.predict(texts).tolist()]
+        classes, probabilities = self.predict_proba(texts)
+        best = probabilities.argmax(axis = 1)
+        return list(zip(classes[best].tolist(),
+                        probabilities[np.arange(len(best)), best].tolist()))
+
+
+class MicroBatcher(object):
+    # Tweets submitted one at a time are predicted in batches of at most
+    # max_batch_size tweets. A batch waits at most max_delay seconds after
+    # its first tweet for more tweets to arrive.
+
+    def __init__(self, predictor, max_batch_size = 256, max_delay = 0.002):
+        self._predictor = predictor
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+
+    def submit(self, text):
+        # Returns a future of the (author, probability) of the tweet. A
+        # tweet that is not a string is rejected here, before it can reach
+        # a batch.
+        if not isinstance(text, str):
+            raise TypeError("expected a string, got " + type(text).__name__)
+        future = concurrent.futures.Future()
+        self._queue.put((text, future))
+        return future
+
+    def predict_author(self, texts):
+        if not isinstance(texts, list):
+            raise TypeError("expected a list of strings, got " + type(texts).__name__)
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self._max_delay
+        while len(batch) < self._max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout = timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Stop once the tweets submitted so far are answered
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                results = self._predictor.predict_author([text for text, _ in batch])
+            except Exception:
+                # Predict the tweets of the failed batch one at a time, so
+                # that only the tweets that fail on their own fail
+                for text, future in batch:
+                    self._predict_one(text, future)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _predict_one(self, text, future):
+        try:
+            future.set_result(self._predictor.predict_author([text])[0])
+        except Exception as exception:
+            future.set_exception(exception)
@@ -0,0 +1,162 @@
+import datetime
+import glob
+import joblib
+import json
+import os
+import tempfile
+import utils
+
+# A directory of trained models that can be queried without loading any
+# of them.
+#
+# Every model is saved uncompressed with joblib, so that its numpy arrays
+# are memory-mapped when it is loaded, along with a <model>-metadata.json
+# file describing it:
+#
+#   model_name, model_class, model_parameters   how the model was built
+#   feature, sparse                             what it was trained on
+#   scores, score_deviations                    cross validation mean and
+#                                               standard deviation
+#   train_time, size, saved_at                  seconds, bytes, date
+#
+# The index.json at the root of the store gathers the metadata of all the
+# models, so that finding a model reads a single small file.
+
+MODEL_STORE_VERSION = 1
+
+INDEX_FILENAME = "index.json"
+
+SCORE_NAMES = ["accuracy", "precision", "recall", "f1", "time"]
+
+
+def metadata_filepath(model_filepath):
+    return os.path.splitext(model_filepath)[0] + "-metadata.json"
+
+
+def save_json(filepath, data):
+    # The temporary file has a name of its own, so that processes saving
+    # the same file at once do not write into each other's
+    descriptor, temporary_filepath = tempfile.mkstemp(dir = os.path.dirname(filepath) or ".",
+                                                      suffix = ".tmp")
+    try:
+        with os.fdopen(descriptor, "w") as f:
+            json.dump(data, f, indent = 2)
+        utils.set_default_permissions(temporary_filepath)
+        os.replace(temporary_filepath, filepath)
+    except BaseException:
+        os.remove(temporary_filepath)
+        raise
+
+
+def make_metadata(model_name, model_class, model_parameters, x_filepath,
+                  evaluator, train_time):
+    # model_parameters is the string the model was initialized from
+    return {"model_name": model_name,
+            "model_class": model_class,
+            "model_parameters": model_parameters,
+            "feature": os.path.splitext(os.path.basename(x_filepath))[0],
+            "sparse": utils.is_sparse_file(x_filepath),
+            "scores": dict(zip(SCORE_NAMES, evaluator.scores.mean(axis = 0).tolist())),
+            "score_deviations": dict(zip(SCORE_NAMES, evaluator.scores.std(axis = 0).tolist())),
+            "train_time": train_time}
+
+
+def save_model(model, filepath, metadata = None):
+    # The metadata is written last, so that it always describes a model
+    # saved in full
+    if os.path.exists(metadata_filepath(filepath)):
+        os.remove(metadata_filepath(filepath))
+
+    temporary_filepath = filepath + ".tmp"
+    joblib.dump(model, temporary_filepath)
+    os.replace(temporary_filepath, filepath)
+
+    if metadata is not None:
+        save_json(metadata_filepath(filepath),
+                  dict(metadata,
+                       version = MODEL_STORE_VERSION,
+                       model_filename = os.path.basename(filepath),
+                       size = os.path.getsize(filepath),
+                       saved_at = datetime.datetime.now().isoformat(timespec = "seconds")))
+
+
+def load_model(filepath, mmap_mode = "r"):
+    return joblib.load(filepath, mmap_mode = mmap_mode)
+
+
+class ModelStore(object):
+    # The models saved with metadata anywhere below dirpath
+
+    def __init__(self, dirpath):
+        self._dirpath = dirpath
+        self._entries = None
+
+    def entries(self):
+        # The metadata of every model, with the path of the model relative
+        # to the store in model_filepath. The metadata files are read
+        # instead of the index when there is none or when it is out of
+        # date: a model was saved after it or is no longer there.
+        if self._entries is None:
+            metadata_filepaths = self._metadata_filepaths()
+            entries = self._read_index(metadata_filepaths)
+            self._entries = self._scan(metadata_filepaths) if entries is None else entries
+        return self._entries
+
+    def rebuild_index(self):
+        os.makedirs(self._dirpath, exist_ok = True)
+        self._entries = self._scan()
+        save_json(os.path.join(self._dirpath, INDEX_FILENAME),
+                  {"version": MODEL_STORE_VERSION, "models": self._entries})
+        return self._entries
+
+    def find(self, model_name = None, feature = None, model_class = None):
+        return [entry for entry in self.entries()
+                if (model_name is None or entry["model_name"] == model_name) and
+                (feature is None or entry["feature"] == feature) and
+                (model_class is None or entry["model_class"] == model_class)]
+
+    def best(self, score = "accuracy", model_name = None, feature = None, model_class = None):
+        entries = self.find(model_name, feature, model_class)
+        if len(entries) == 0:
+            raise ValueError("No model in " + self._dirpath + " matches")
+        return max(entries, key = lambda entry: entry["scores"][score])
+
+    def load(self, entry, mmap_mode = "r"):
+        return load_model(os.path.join(self._dirpath, entry["model_filepath"]), mmap_mode)
+
+    def _metadata_filepaths(self):
+        pattern = os.path.join(self._dirpath, "**", "*-metadata.json")
+        return sorted(glob.glob(pattern, recursive = True))
+
+    def _read_index(self, metadata_filepaths):
+        # The entries of the index, None if it is missing or out of date
+        index_filepath = os.path.join(self._dirpath, INDEX_FILENAME)
+        try:
+            index_time = os.path.getmtime(index_filepath)
+            if any(os.path.getmtime(filepath) > index_time for filepath in metadata_filepaths):
+                return None
+            with open(index_filepath, "r") as f:
+                entries = json.load(f)["models"]
+        except FileNotFoundError:
+            return None
+        indexed_filepaths = {os.path.normpath(metadata_filepath(
+                                 os.path.join(self._dirpath, entry["model_filepath"])))
+                             for entry in entries}
+        if indexed_filepaths != set(map(os.path.normpath, metadata_filepaths)):
+            return None
+        return entries
+
+    def _scan(self, metadata_filepaths = None):
+        if metadata_filepaths is None:
+            metadata_filepaths = self._metadata_filepaths()
+        entries = []
+        for filepath in metadata_filepaths:
+            with open(filepath, "r") as f:
+                entry = json.load(f)
+            if entry.get("version") != MODEL_STORE_VERSION:
+                continue
+            entry["model_filepath"] = os.path.relpath(
+                os.path.join(os.path.dirname(filepath), entry["model_filename"]),
+                self._dirpath)
+            entries.append(entry)
+        return entries
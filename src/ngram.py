@@ -0,0 +1,86 @@
+import numpy as np
+import progressbar
+import scipy.sparse
+from sklearn.utils import murmurhash3_32
+
+# N-grams are hashed into a fixed number of columns with MurmurHash, which,
+# unlike the built-in hash, gives the same columns in every process.
+# Every word of the vocabulary is hashed once; the hashes of the tokens of
+# an n-gram are then combined and mixed with vectorized 64 bit arithmetic.
+
+SEED = 55861
+
+PRIME = np.uint64(0x100000001b3)
+
+
+def mix(hashes):
+    # Finalization step of MurmurHash3 (64 bit variant)
+    hashes = hashes ^ (hashes >> np.uint64(33))
+    hashes = hashes * np.uint64(0xff51afd7ed558ccd)
+    hashes = hashes ^ (hashes >> np.uint64(33))
+    hashes = hashes * np.uint64(0xc4ceb9fe1a85ec53)
+    return hashes ^ (hashes >> np.uint64(33))
+
+
+def hash_ngrams(token_hashes, lengths, n):
+    # Returns the row and the hash of every n-gram of the documents whose
+    # token hashes are concatenated in token_hashes.
+    starts = np.cumsum(lengths) - lengths
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    positions = np.arange(len(token_hashes)) - starts[rows]
+    indices = np.flatnonzero(positions <= lengths[rows] - n)
+
+    hashes = token_hashes[indices]
+    for i in range(1, n):
+        hashes = hashes * PRIME + token_hashes[indices + i]
+    return rows[indices], mix(hashes ^ np.uint64(n))
+
+
+def hash_vocabulary(vocabulary):
+    return np.fromiter((murmurhash3_32(word, seed = SEED, positive = True)
+                        for word in vocabulary),
+                       dtype = np.uint64,
+                       count = len(vocabulary))
+
+
+def compute_hashed_ngram_embedding(corpus,
+                                   ngram_range = (2, 2),
+                                   dim = 2 ** 18,
+                                   batch_size = 100000,
+                                   dtype = np.float64,
+                                   progress = True):
+    # Returns a sparse (tweet count x dim) matrix counting the n-grams of
+    # every tweet of the TokenCorpus, for every n in ngram_range (inclusive).
+    vocabulary_hashes = hash_vocabulary(corpus.vocabulary)
+
+    row_count = len(corpus)
+    bar = (progressbar.ProgressBar if progress else progressbar.NullBar)(
+        max_value = row_count,
+        prefix = "{0}-{1}-gram ".format(*ngram_range))
+
+    batches = []
+    for batch_start in range(0, row_count, batch_size):
+        batch = corpus.slice(batch_start, min(batch_start + batch_size, row_count))
+        lengths = batch.lengths()
+        token_hashes = vocabulary_hashes[batch.token_ids]
+
+        rows = []
+        cols = []
+        for n in range(ngram_range[0], ngram_range[1] + 1):
+            ngram_rows, ngram_hashes = hash_ngrams(token_hashes, lengths, n)
+            rows.append(ngram_rows)
+            cols.append((ngram_hashes % np.uint64(dim)).astype(np.int64))
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+
+        # Duplicate (row, col) pairs are summed up by the conversion.
+        batches.append(scipy.sparse.csr_matrix(
+            (np.ones(len(rows), dtype = dtype), (rows, cols)),
+            shape = (len(batch), dim)))
+
+        bar.update(batch_start + len(batch))
+    bar.finish()
+
+    if len(batches) == 0:
+        return scipy.sparse.csr_matrix((0, dim), dtype = dtype)
+    return scipy.sparse.vstack(batches, format = "csr")
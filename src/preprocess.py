@@ -1,5 +1,6 @@
 import argparse
 import json
+import multiprocessing
 import pandas as pd
 import numpy as np
 import progressbar
@@ -7,12 +8,14 @@ from collections import Counter
 from datetime import datetime
 import os
 import pickle
+import re
 import sys
+import utils
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description = ("Preprocess raw json " +
                                                     "files and store them as "
-                                                    "Pandas pickle files"))
+                                                    "Pandas pickle or parquet files"))
     parser.add_argument('raw_tweet_filepath',
                         metavar = 'raw-tweet-filepath',
                         type = str,
@@ -24,11 +27,11 @@ def parse_arguments():
     parser.add_argument('processed_tweet_filepath',
                         metavar = 'processed-tweet-filepath',
                         type = str,
-                        help = "pickle file containing processed tweet information")
+                        help = "pickle or parquet file containing processed tweet information")
     parser.add_argument('processed_user_filepath',
                         metavar = 'processed-user-filepath',
                         type = str,
-                        help = "pickle file containing processed user information")
+                        help = "pickle or parquet file containing processed user information")
     parser.add_argument('min_tweet_count',
                         metavar = 'min-tweet-count',
                         type = int,
@@ -44,6 +47,21 @@ def parse_arguments():
                         type = int,
                         default = sys.maxsize,
                         help = "maximum number of authors (in descending order of number of tweets) that will be kept in the data")
+    parser.add_argument('--worker-count',
+                        type = int,
+                        default = 1,
+                        help = "number of processes parsing the raw json files in parallel")
+    parser.add_argument('--chunk-size',
+                        type = int,
+                        default = 64 * 1024 * 1024,
+                        help = "size (in bytes) of the byte ranges handed to each worker")
+    parser.add_argument('--ingestion-mode',
+                        type = str,
+                        choices = ["single-pass", "two-pass"],
+                        default = "single-pass",
+                        help = ("single-pass loads every tweet before filtering, " +
+                                "two-pass first counts tweets per author and only " +
+                                "parses the tweets of the selected authors"))
 
     return parser.parse_args()
 
@@ -62,6 +80,88 @@ def raw_json_reader(filepath, transformer):
     return data
 
 
+def split_byte_ranges(filepath, chunk_size):
+    filesize = os.path.getsize(filepath)
+    ranges = []
+    start = 0
+    with open(filepath, 'rb') as f:
+        while start < filesize:
+            # Move the boundary forward to the next newline so that
+            # every range consists of complete json records.
+            f.seek(min(start + chunk_size, filesize))
+            f.readline()
+            end = min(f.tell(), filesize)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def raw_json_chunk_reader(task):
+    filepath, start, end, transformer = task
+    columns = {}
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).splitlines()
+    for line in lines:
+        if not line.strip():
+            continue
+        record = transformer(json.loads(line))
+        for key, value in record.items():
+            columns.setdefault(key, []).append(value)
+    return pd.DataFrame(columns), end - start
+
+
+def map_chunks(fun, tasks, worker_count, max_value):
+    # Yields the result of every task, in order, along with a progress bar
+    # measured in bytes. Every result must end with the number of bytes
+    # the task has processed.
+    bar = progressbar.ProgressBar(max_value = max_value)
+    processed_bytes = 0
+    if worker_count <= 1:
+        results = map(fun, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(worker_count)
+        results = pool.imap(fun, tasks)
+    try:
+        for result in results:
+            processed_bytes += result[-1]
+            bar.update(processed_bytes)
+            yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+    bar.finish()
+
+
+def concatenate_chunks(chunks, ignore_index, columns = None):
+    if len(chunks) == 0:
+        return pd.DataFrame(columns = columns)
+    # A chunk in which a column only holds None is typed as object,
+    # so let pandas settle on the common dtype after concatenation.
+    return pd.concat(chunks, ignore_index = ignore_index).infer_objects()
+
+
+def parallel_json_reader(filepath, transformer, worker_count, chunk_size):
+    filesize = os.path.getsize(filepath)
+    tasks = [(filepath, start, end, transformer)
+             for start, end in split_byte_ranges(filepath, chunk_size)]
+    chunks = [chunk for chunk, _ in map_chunks(raw_json_chunk_reader,
+                                                tasks,
+                                                worker_count,
+                                                filesize)]
+    return concatenate_chunks(chunks, ignore_index = True)
+
+
+def read_json_dataframe(filepath,
+                        transformer,
+                        worker_count = 1,
+                        chunk_size = 64 * 1024 * 1024):
+    if worker_count <= 1:
+        return pd.DataFrame(raw_json_reader(filepath, transformer))
+    return parallel_json_reader(filepath, transformer, worker_count, chunk_size)
+
+
 def json_to_pickle(input_filepath,
                    output_filepath,
                    transformer,
@@ -72,6 +172,20 @@ def json_to_pickle(input_filepath,
 
 
 
+TWEET_COLUMN_NAMES = ["id",
+                      "retweet_count",
+                      "user_id",
+                      "year",
+                      "month",
+                      "week",
+                      "day",
+                      "hour",
+                      "minute",
+                      "in_reply_to_user_id",
+                      "text_body",
+                      "favorite_count"]
+
+
 def extract_tweet_information(record):
     tweet_column_names = ["in_reply_to_screen_name",
                           "screen_name"]
@@ -133,6 +247,38 @@ def extract_tweet_information(record):
     }
 
 
+def select_authors(id_count_pairs,
+                   min_tweet_count,
+                   max_tweet_count,
+                   max_author_count):
+
+    def snd(pair): return pair[1]
+
+    print("Selecting users with ", min_tweet_count, " <= tweets <= ", max_tweet_count)
+
+    filtered_id_count_pairs = filter(
+        lambda p: min_tweet_count <= p[1] <= max_tweet_count,
+        id_count_pairs)
+    sorted_id_count_pairs = sorted(filtered_id_count_pairs,
+                                   key = snd,
+                                   reverse = True)
+    return sorted_id_count_pairs[0:max_author_count]
+
+
+def print_filter_statistics(original_tweet_count,
+                            pruned_tweet_count,
+                            original_author_count,
+                            pruned_author_count,
+                            selected_id_count_pairs):
+    print("Original Tweet Count:  ", original_tweet_count)
+    print("Pruned Tweet Count:    ", pruned_tweet_count)
+    print("Retained Tweet Count:  ", sum(p[1] for p in selected_id_count_pairs))
+
+    print("Original Author Count: ", original_author_count)
+    print("Pruned Author Count:   ", pruned_author_count)
+    print("Retained Author Count: ", len(selected_id_count_pairs))
+
+
 def filter_tweet_dataset(tweets,
                          min_tweet_count,
                          max_tweet_count,
@@ -140,48 +286,182 @@ def filter_tweet_dataset(tweets,
 
     def fst(pair): return pair[0]
 
-    def snd(pair): return pair[1]
-
     print("Removing records with empty tweets: ", end = "")
     pruned_tweets = tweets[tweets.text_body.map(len)!=0]
     print(tweets.shape[0] - pruned_tweets.shape[0], "records removed")
 
-    print("Selecting users with ", min_tweet_count, " <= tweets <= ", max_tweet_count)
-
     id_count_pairs =  Counter(pruned_tweets.user_id).items()
-    filtered_id_count_pairs = filter(
-        lambda p: min_tweet_count <= p[1] <= max_tweet_count,
-        id_count_pairs)
-    sorted_id_count_pairs = sorted(filtered_id_count_pairs,
-                                   key = snd,
-                                   reverse = True)
-    selected_id_count_pairs = sorted_id_count_pairs[0:max_author_count]
+    selected_id_count_pairs = select_authors(id_count_pairs,
+                                             min_tweet_count,
+                                             max_tweet_count,
+                                             max_author_count)
 
     user_ids = set(map(fst, selected_id_count_pairs))
-    tweet_counts = map(snd, selected_id_count_pairs)
 
-    print("Original Tweet Count:  ", tweets.shape[0])
-    print("Pruned Tweet Count:    ", pruned_tweets.shape[0])
-    print("Retained Tweet Count:  ", sum(tweet_counts))
-
-    print("Original Author Count: ", tweets.user_id.unique().shape[0])
-    print("Pruned Author Count:   ", len(id_count_pairs))
-    print("Retained Author Count: ", len(user_ids))
+    print_filter_statistics(tweets.shape[0],
+                            pruned_tweets.shape[0],
+                            tweets.user_id.unique().shape[0],
+                            len(id_count_pairs),
+                            selected_id_count_pairs)
 
     return pruned_tweets[pruned_tweets["user_id"].map(lambda i: i in user_ids)]
 
 
+USER_ID_PATTERN = re.compile(rb'"user_id"\s*:\s*(-?\d+)')
+TEXT_RANGE_PATTERN = re.compile(rb'"display_text_range"\s*:\s*\[\s*(\d+)\s*,\s*(\d+)\s*\]')
+
+
+def scan_tweet_line(line):
+    # The author of the tweet and whether its text body is empty, picked
+    # out of the line without parsing it (the display text range lies
+    # within the text). Lines in which a field is missing or occurs more
+    # than once, as in nested tweets, are parsed.
+    user_ids = USER_ID_PATTERN.findall(line)
+    text_ranges = TEXT_RANGE_PATTERN.findall(line)
+    if len(user_ids) == 1 and len(text_ranges) == 1:
+        return int(user_ids[0]), int(text_ranges[0][0]) >= int(text_ranges[0][1])
+    record = json.loads(line)
+    relevant_text_range = record["display_text_range"]
+    text_body = record["text"][relevant_text_range[0]: relevant_text_range[1]]
+    return record["user_id"], len(text_body) == 0
+
+
+def scan_tweet_chunk(task):
+    # First pass of the two-pass ingestion: only remember who wrote each
+    # non-empty tweet and where its line starts, without parsing it.
+    filepath, start, end = task
+    user_ids = []
+    offsets = []
+    line_numbers = []
+    all_user_ids = set()
+    line_count = 0
+    offset = start
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).splitlines(keepends = True)
+    for line in lines:
+        if line.strip():
+            user_id, empty = scan_tweet_line(line)
+            all_user_ids.add(user_id)
+            if not empty:
+                user_ids.append(user_id)
+                offsets.append(offset)
+                line_numbers.append(line_count)
+            line_count += 1
+        offset += len(line)
+    return (np.array(user_ids, dtype = np.int64),
+            np.array(offsets, dtype = np.int64),
+            np.array(line_numbers, dtype = np.int64),
+            line_count,
+            all_user_ids,
+            end - start)
+
+
+def parse_selected_tweet_chunk(task):
+    # Second pass of the two-pass ingestion: parse the lines starting at
+    # the given offsets and index them by their line number in the file.
+    filepath, start, end, offsets, line_numbers = task
+    columns = {}
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    for offset in offsets:
+        line_start = offset - start
+        line_end = data.find(b"\n", line_start)
+        if line_end < 0:
+            line_end = len(data)
+        record = extract_tweet_information(json.loads(data[line_start:line_end]))
+        for key, value in record.items():
+            columns.setdefault(key, []).append(value)
+    return pd.DataFrame(columns, index = line_numbers), end - start
+
+
+def two_pass_tweet_reader(filepath,
+                          min_tweet_count,
+                          max_tweet_count,
+                          max_author_count,
+                          worker_count = 1,
+                          chunk_size = 64 * 1024 * 1024):
+
+    def fst(pair): return pair[0]
+
+    filesize = os.path.getsize(filepath)
+    byte_ranges = split_byte_ranges(filepath, chunk_size)
+
+    print("Counting tweets per author...")
+    scans = list(map_chunks(scan_tweet_chunk,
+                            [(filepath, start, end) for start, end in byte_ranges],
+                            worker_count,
+                            filesize))
+
+    counter = Counter()
+    all_user_ids = set()
+    original_tweet_count = 0
+    for user_ids, _, _, line_count, chunk_user_ids, _ in scans:
+        counter.update(user_ids.tolist())
+        all_user_ids.update(chunk_user_ids)
+        original_tweet_count += line_count
+
+    id_count_pairs = counter.items()
+    selected_id_count_pairs = select_authors(id_count_pairs,
+                                             min_tweet_count,
+                                             max_tweet_count,
+                                             max_author_count)
+    selected_user_ids = np.array(list(map(fst, selected_id_count_pairs)),
+                                 dtype = np.int64)
+
+    print_filter_statistics(original_tweet_count,
+                            sum(counter.values()),
+                            len(all_user_ids),
+                            len(id_count_pairs),
+                            selected_id_count_pairs)
+
+    print("Parsing tweets of the selected authors...")
+    tasks = []
+    first_line_number = 0
+    for (start, end), scan in zip(byte_ranges, scans):
+        user_ids, offsets, line_numbers, line_count, _, _ = scan
+        selected = np.isin(user_ids, selected_user_ids)
+        if selected.any():
+            tasks.append((filepath,
+                          start,
+                          end,
+                          offsets[selected],
+                          line_numbers[selected] + first_line_number))
+        first_line_number += line_count
+    del scans
+
+    chunks = [chunk for chunk, _ in map_chunks(parse_selected_tweet_chunk,
+                                                tasks,
+                                                worker_count,
+                                                sum(end - start for _, start, end, _, _ in tasks))]
+    return concatenate_chunks(chunks, ignore_index = False, columns = TWEET_COLUMN_NAMES)
+
+
 def process_tweet_data(raw_tweet_filepath,
                        processed_tweet_filepath,
                        min_tweet_count,
                        max_tweet_count,
-                       max_author_count):
+                       max_author_count,
+                       worker_count = 1,
+                       chunk_size = 64 * 1024 * 1024,
+                       ingestion_mode = "single-pass"):
 
     print("Preprocessing tweets...")
-    data = pd.DataFrame(raw_json_reader(raw_tweet_filepath, extract_tweet_information))
-    data = filter_tweet_dataset(data, min_tweet_count, max_tweet_count, max_author_count)
-    data.to_pickle(processed_tweet_filepath)
-    print('Written to:', processed_tweet_filepath)
+    if ingestion_mode == "two-pass":
+        data = two_pass_tweet_reader(raw_tweet_filepath,
+                                     min_tweet_count,
+                                     max_tweet_count,
+                                     max_author_count,
+                                     worker_count,
+                                     chunk_size)
+    else:
+        data = read_json_dataframe(raw_tweet_filepath,
+                                   extract_tweet_information,
+                                   worker_count,
+                                   chunk_size)
+        data = filter_tweet_dataset(data, min_tweet_count, max_tweet_count, max_author_count)
+    utils.write_data_to_file(data, processed_tweet_filepath)
 
 
 def extract_user_information(record):
@@ -207,12 +487,16 @@ def extract_user_information(record):
         "friends_count": record["friends_count"]
     }
 
-def process_user_data(raw_user_filepath, processed_user_filepath):
+def process_user_data(raw_user_filepath,
+                      processed_user_filepath,
+                      worker_count = 1,
+                      chunk_size = 64 * 1024 * 1024):
     print("Preprocessing users...")
-    print("Preprocessing tweets...")
-    data = pd.DataFrame(raw_json_reader(raw_user_filepath, extract_user_information))
-    data.to_pickle(processed_user_filepath)
-    print('Written to:', processed_user_filepath)
+    data = read_json_dataframe(raw_user_filepath,
+                               extract_user_information,
+                               worker_count,
+                               chunk_size)
+    utils.write_data_to_file(data, processed_user_filepath)
 
 
 def main():
@@ -222,10 +506,16 @@ def main():
                        args.processed_tweet_filepath,
                        min_tweet_count = args.min_tweet_count,
                        max_tweet_count = args.max_tweet_count,
-                       max_author_count = args.max_author_count)
+                       max_author_count = args.max_author_count,
+                       worker_count = args.worker_count,
+                       chunk_size = args.chunk_size,
+                       ingestion_mode = args.ingestion_mode)
 
     process_user_data(args.raw_user_filepath,
-                      args.processed_user_filepath)
+                      args.processed_user_filepath,
+                      worker_count = args.worker_count,
+                      chunk_size = args.chunk_size)
 
 
-main()
+if __name__ == "__main__":
+    main()
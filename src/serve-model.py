@@ -0,0 +1,155 @@
+import collections
+import http.server
+import json
+import sys
+import argparse
+from featurizer import FEATURE_SETS
+from inference import MicroBatcher, Predictor
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = ("Predict the authors of tweets " +
+                                                    "with a trained model, over HTTP " +
+                                                    "or one tweet per line of stdin"))
+    parser.add_argument("model_filepath",
+                        metavar = "model-filepath",
+                        type = str,
+                        help = "file containing the trained model (the model store with --best)")
+    parser.add_argument("featurizer_dirpath",
+                        metavar = "featurizer-dirpath",
+                        type = str,
+                        help = "directory containing the featurizer saved by extract-features.py")
+    parser.add_argument("feature_set",
+                        metavar = "feature-set",
+                        type = str,
+                        choices = FEATURE_SETS,
+                        help = "feature set the model was trained on")
+    parser.add_argument("--sparse",
+                        action = "store_true",
+                        help = "the model was trained on sparse (npz) n-gram features")
+    parser.add_argument("--best",
+                        action = "store_true",
+                        help = ("serve the most accurate model trained on the feature set " +
+                                "in the model store given as model-filepath"))
+    parser.add_argument("--max-batch-size",
+                        type = int,
+                        default = 256,
+                        help = "largest number of tweets predicted at once")
+    parser.add_argument("--max-delay",
+                        type = float,
+                        default = 2.0,
+                        help = "milliseconds a batch waits for more tweets")
+    parser.add_argument("--port",
+                        type = int,
+                        default = None,
+                        help = "serve POST /predict on this port instead of reading stdin")
+
+    return parser.parse_args()
+
+
+def format_prediction(prediction):
+    author, probability = prediction
+    return {"author": author, "probability": probability}
+
+
+def format_result(future):
+    # The prediction of a tweet, or the error predicting it
+    try:
+        return format_prediction(future.result())
+    except Exception as exception:
+        return {"error": str(exception)}
+
+
+def is_text_list(texts):
+    return isinstance(texts, list) and all(isinstance(text, str) for text in texts)
+
+
+def serve_stdin(batcher, max_pending):
+    # Tweets are submitted as they are read and answered in order, one JSON
+    # object per line (with an error instead of a prediction for a tweet
+    # that could not be predicted); up to max_pending tweets are in flight
+    # at once.
+    pending = collections.deque()
+    for line in sys.stdin:
+        pending.append(batcher.submit(line.rstrip("\n")))
+        while len(pending) > max_pending:
+            print(json.dumps(format_result(pending.popleft())))
+    while len(pending) > 0:
+        print(json.dumps(format_result(pending.popleft())))
+    sys.stdout.flush()
+
+
+def serve_http(batcher, port):
+    # POST /predict with {"texts": [...]} answers {"predictions": [...]};
+    # the tweets of concurrent requests are batched together. A malformed
+    # request is answered with 400 and a failed prediction with 500, both
+    # with {"error": ...}.
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def send_json(self, status, response):
+            body = json.dumps(response).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self.send_json(404, {"error": "not found"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                texts = request["texts"]
+            except (ValueError, KeyError, TypeError):
+                texts = None
+            if not is_text_list(texts):
+                self.send_json(400, {"error": "expected a JSON object with a list of texts"})
+                return
+            try:
+                predictions = batcher.predict_author(texts)
+            except Exception as exception:
+                self.send_json(500, {"error": str(exception)})
+                return
+            self.send_json(200, {"predictions": list(map(format_prediction, predictions))})
+
+        def log_message(self, format, *args):
+            pass
+
+    class Server(http.server.ThreadingHTTPServer):
+        # The default backlog of 5 connections drops clients under load
+        request_queue_size = 1024
+        daemon_threads = True
+
+    server = Server(("127.0.0.1", port), Handler)
+    print("Serving on port", port, file = sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+def main():
+    args = parse_arguments()
+
+    if args.best:
+        predictor = Predictor.load_best(args.model_filepath,
+                                        args.featurizer_dirpath,
+                                        args.feature_set)
+    else:
+        predictor = Predictor.load(args.model_filepath,
+                                   args.featurizer_dirpath,
+                                   args.feature_set,
+                                   args.sparse)
+    batcher = MicroBatcher(predictor,
+                           max_batch_size = args.max_batch_size,
+                           max_delay = args.max_delay / 1000)
+
+    if args.port is None:
+        serve_stdin(batcher, 4 * args.max_batch_size)
+    else:
+        serve_http(batcher, args.port)
+
+    batcher.close()
+
+if __name__ =="__main__":
+    main()
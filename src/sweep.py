@@ -0,0 +1,144 @@
+import itertools
+import joblib
+import math
+import os
+import shutil
+import time
+from evaluation import Evaluator
+from training import initialize_model, prepare_features, predict_rows, split_folds
+
+# Hyperparameter sweeps sharing work between the points of a grid.
+#
+# The number of estimators of an ensemble is swept by growing the same
+# models: with warm_start, going from 100 to 200 trees fits 100 more trees
+# instead of 200 new ones. The other parameters make up the
+# configurations, which are pruned by successive halving: after every
+# number of estimators, only the best configurations (by mean F1 over the
+# folds) are grown further. The models being grown are kept on disk between
+# numbers of estimators, so only one of them is in memory at a time.
+
+RESOURCE_PARAMETER = "n_estimators"
+
+
+def expand_grid(grid):
+    # Every combination of the values of the parameters other than the
+    # resource parameter, and the sorted values of the resource parameter
+    names = sorted(name for name in grid if name != RESOURCE_PARAMETER)
+    configurations = [dict(zip(names, values))
+                      for values in itertools.product(*[grid[name] for name in names])]
+    levels = sorted(grid.get(RESOURCE_PARAMETER, [None]))
+    return configurations, levels
+
+
+def format_point(parameters):
+    return ",".join("{0}={1}".format(name, parameters[name])
+                    for name in sorted(parameters)).replace(os.sep, "_")
+
+
+def grown_model_filepath(models_dirpath, configuration, fold):
+    return os.path.join(models_dirpath, "{0}-{1}.pkl".format(configuration, fold))
+
+
+def save_summary(filepath, rows):
+    with open(filepath, "w") as f:
+        f.write("Point, Accuracy, Precision, Recall, F1, Time\n")
+        for point, scores in rows:
+            f.write(point + "," + ",".join("{0:.18e}".format(score) for score in scores) + "\n")
+
+
+def sweep_model(model_class, model_parameters, grid, X, Y,
+                sweep_dirpath, n_splits = 5, random_state = 55861,
+                halving_factor = 2):
+    # Evaluates the points of the grid with cross validation, saving the
+    # scores of every point evaluated to <sweep_dirpath>/<point>/ and a
+    # summary of all of them, best first, to <sweep_dirpath>/summary.txt.
+    # The time column holds the fit time of all the estimators of a point
+    # (including those grown for the previous points) plus its predict time.
+    configurations, levels = expand_grid(grid)
+    splits = split_folds(X, Y, n_splits, random_state)
+
+    warm_start = (levels[0] is not None and
+                  "warm_start" in initialize_model(model_class, str(model_parameters)).get_params())
+
+    # Not a point directory, whose names always hold a "="
+    models_dirpath = os.path.join(sweep_dirpath, "grown-models")
+    shutil.rmtree(models_dirpath, ignore_errors = True)
+    os.makedirs(models_dirpath)
+    try:
+        return sweep_levels(model_class, model_parameters, configurations, levels,
+                            X, Y, splits, sweep_dirpath, models_dirpath, warm_start,
+                            halving_factor)
+    finally:
+        shutil.rmtree(models_dirpath, ignore_errors = True)
+
+
+def sweep_levels(model_class, model_parameters, configurations, levels, X, Y, splits,
+                 sweep_dirpath, models_dirpath, warm_start, halving_factor):
+    n_splits = len(splits)
+    fit_times = [[0.0] * n_splits for _ in configurations]
+    surviving = list(range(len(configurations)))
+    rows = []
+
+    for level_index, level in enumerate(levels):
+        # The models of the last level are not grown any further
+        keep_models = warm_start and level_index + 1 < len(levels)
+        f1_scores = {}
+        for c in surviving:
+            parameters = dict(model_parameters, **configurations[c])
+            if level is not None:
+                parameters[RESOURCE_PARAMETER] = level
+            point = format_point(parameters)
+
+            print("Sweeping", model_class, point)
+
+            evaluator = Evaluator(n_splits)
+            evaluator.begin()
+            for fold, (train_indices, test_indices) in enumerate(splits):
+                model_filepath = grown_model_filepath(models_dirpath, c, fold)
+                if level_index == 0 or not warm_start:
+                    model = initialize_model(model_class,
+                                             str(dict(parameters, warm_start = True)
+                                                 if warm_start else parameters))
+                    fit_times[c][fold] = 0.0
+                else:
+                    model = joblib.load(model_filepath)
+                    model.set_params(**{RESOURCE_PARAMETER: level})
+
+                start_time = time.time()
+                model.fit(prepare_features(model, X[train_indices]), Y[train_indices])
+                fit_times[c][fold] += time.time() - start_time
+
+                start_time = time.time()
+                Y_pred = predict_rows(model, X, test_indices)
+                predict_time = time.time() - start_time
+
+                evaluator.evaluate(Y[test_indices], Y_pred,
+                                   elapsed = fit_times[c][fold] + predict_time)
+                if keep_models:
+                    joblib.dump(model, model_filepath)
+                elif os.path.exists(model_filepath):
+                    os.remove(model_filepath)
+                del model
+            evaluator.finish()
+
+            point_dirpath = os.path.join(sweep_dirpath, point)
+            os.makedirs(point_dirpath, exist_ok = True)
+            evaluator.save(os.path.join(point_dirpath, "evaluation-raw.txt"),
+                           os.path.join(point_dirpath, "evaluation-aggregated.txt"))
+
+            f1_scores[c] = evaluator.scores[:, 3].mean()
+            rows.append((point, evaluator.scores.mean(axis = 0)))
+
+        if level_index + 1 < len(levels):
+            keep_count = max(1, math.ceil(len(surviving) / halving_factor))
+            ranked = sorted(surviving, key = lambda c: f1_scores[c], reverse = True)
+            for c in ranked[keep_count:]:
+                for fold in range(n_splits):
+                    if os.path.exists(grown_model_filepath(models_dirpath, c, fold)):
+                        os.remove(grown_model_filepath(models_dirpath, c, fold))
+            surviving = ranked[:keep_count]
+
+    rows.sort(key = lambda row: row[1][3], reverse = True)
+    save_summary(os.path.join(sweep_dirpath, "summary.txt"), rows)
+
+    return rows
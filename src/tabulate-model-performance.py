@@ -2,43 +2,43 @@ import os
 import numpy as np
 import pandas as pd
 import sys
-
-def get_basename_from_path(path):
-    return os.path.basename(os.path.normpath(path))
-
-
-def prepend_path(prefix_dirpath, children_dirpaths):
-    return map(lambda p: os.path.join(prefix_dirpath, p),
-               children_dirpaths)
+from model_store import ModelStore
 
 def list_dirpaths(parent_dirpath):
-    return filter(os.path.isdir,
-                  prepend_path(parent_dirpath,
-                               os.listdir(parent_dirpath)))
+    return [os.path.join(parent_dirpath, name) for name in sorted(os.listdir(parent_dirpath))
+            if os.path.isdir(os.path.join(parent_dirpath, name))]
 
-def create_table(model_eval_dirpath):
 
+def read_evaluations(model_dirpath):
+    # The accuracies of the evaluation-aggregated.txt files of
+    # <model>/<feature>/, which models trained before the model store have
+    # without a metadata file
     evaluation = {}
 
-    model_dirpaths = list_dirpaths(model_eval_dirpath)
-
-    for model_dirpath in model_dirpaths:
+    for model_feature_dirpath in list_dirpaths(model_dirpath):
+        model = os.path.basename(model_feature_dirpath)
+        for feature_dirpath in list_dirpaths(model_feature_dirpath):
+            evaluation_filepath = os.path.join(feature_dirpath, "evaluation-aggregated.txt")
+            if not os.path.exists(evaluation_filepath):
+                continue
+            scores = np.loadtxt(evaluation_filepath,
+                                delimiter = ",",
+                                skiprows = 1,
+                                ndmin = 2)
+            evaluation.setdefault(model, {})
+            evaluation[model][os.path.basename(feature_dirpath)] = round(float(scores[0, 0]) * 100, 2)
 
-        model = get_basename_from_path(model_dirpath)
-        evaluation[model] = {}
+    return evaluation
 
-        feature_dirpaths = list_dirpaths(model_dirpath)
 
-        for feature_dirpath in feature_dirpaths:
-            feature = get_basename_from_path(feature_dirpath)
-            scores = np.loadtxt(os.path.join(feature_dirpath,
-                                             "evaluation-aggregated.txt"),
-                                delimiter = ",",
-                                skiprows = 1)
-            accuracy = scores[0,0]
-            time = scores[0,4]
+def create_table(model_dirpath):
+    # The accuracies are read from the index of the model store, and from
+    # the evaluation files for the models without metadata
+    evaluation = read_evaluations(model_dirpath)
 
-            evaluation[model][feature] = round(accuracy * 100, 2)
+    for entry in ModelStore(model_dirpath).entries():
+        evaluation.setdefault(entry["model_name"], {})
+        evaluation[entry["model_name"]][entry["feature"]] = round(entry["scores"]["accuracy"] * 100, 2)
 
     return evaluation
 
@@ -49,7 +49,7 @@ def regularize_mapping(evaluation_mapping,
     df = pd.DataFrame()
     colnames = set()
     for model in models:
-        feature_eval = evaluation_mapping[model]
+        feature_eval = evaluation_mapping.get(model, {})
         values = []
         for feature in features:
             value = feature_eval.get(feature, "???")
@@ -79,7 +79,12 @@ if __name__ == "__main__":
                              "KNN-manhattan",
                              "KNN-braycurtis",
                              "KNN-chebyshev",
-                             "KNN-canberra"],
+                             "KNN-canberra",
+                             "ANN-euclidean",
+                             "ANN-manhattan",
+                             "ANN-braycurtis",
+                             "ANN-chebyshev",
+                             "ANN-canberra"],
                             ["X-linguistic-feature",
                              "X-trigram",
                              "X-bigram",
@@ -0,0 +1,102 @@
+import multiprocessing
+import progressbar
+import re
+import sys
+
+# A token is either a run of alphabetic characters or a single character
+# that is neither alphabetic nor whitespace.
+#
+# [^\W\d_] matches the characters for which str.isalpha() holds, and also
+# the numeric characters that are neither decimal digits nor alphabetic
+# (such as '²'). Those are rare and never ASCII, so instead of slowing down
+# the main pattern with them, the few tokens containing them are split
+# afterwards.
+
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\S")
+
+
+# The ranges of the characters that are numeric but neither decimal nor
+# alphabetic in Unicode 14.0, that is
+#
+#   [c for c in range(sys.maxunicode + 1)
+#    if chr(c).isnumeric() and not chr(c).isdecimal() and not chr(c).isalpha()]
+#
+# listed rather than computed, since going through every code point takes
+# a noticeable time in every process importing this module.
+
+NUMERIC_RANGES = [(0x000b2, 0x000b3), (0x000b9, 0x000b9), (0x000bc, 0x000be), (0x009f4, 0x009f9),
+                  (0x00b72, 0x00b77), (0x00bf0, 0x00bf2), (0x00c78, 0x00c7e), (0x00d58, 0x00d5e),
+                  (0x00d70, 0x00d78), (0x00f2a, 0x00f33), (0x01369, 0x0137c), (0x016ee, 0x016f0),
+                  (0x017f0, 0x017f9), (0x019da, 0x019da), (0x02070, 0x02070), (0x02074, 0x02079),
+                  (0x02080, 0x02089), (0x02150, 0x02182), (0x02185, 0x02189), (0x02460, 0x0249b),
+                  (0x024ea, 0x024ff), (0x02776, 0x02793), (0x02cfd, 0x02cfd), (0x03007, 0x03007),
+                  (0x03021, 0x03029), (0x03038, 0x0303a), (0x03192, 0x03195), (0x03220, 0x03229),
+                  (0x03248, 0x0324f), (0x03251, 0x0325f), (0x03280, 0x03289), (0x032b1, 0x032bf),
+                  (0x0a6e6, 0x0a6ef), (0x0a830, 0x0a835), (0x10107, 0x10133), (0x10140, 0x10178),
+                  (0x1018a, 0x1018b), (0x102e1, 0x102fb), (0x10320, 0x10323), (0x10341, 0x10341),
+                  (0x1034a, 0x1034a), (0x103d1, 0x103d5), (0x10858, 0x1085f), (0x10879, 0x1087f),
+                  (0x108a7, 0x108af), (0x108fb, 0x108ff), (0x10916, 0x1091b), (0x109bc, 0x109bd),
+                  (0x109c0, 0x109cf), (0x109d2, 0x109ff), (0x10a40, 0x10a48), (0x10a7d, 0x10a7e),
+                  (0x10a9d, 0x10a9f), (0x10aeb, 0x10aef), (0x10b58, 0x10b5f), (0x10b78, 0x10b7f),
+                  (0x10ba9, 0x10baf), (0x10cfa, 0x10cff), (0x10e60, 0x10e7e), (0x10f1d, 0x10f26),
+                  (0x10f51, 0x10f54), (0x10fc5, 0x10fcb), (0x11052, 0x11065), (0x111e1, 0x111f4),
+                  (0x1173a, 0x1173b), (0x118ea, 0x118f2), (0x11c5a, 0x11c6c), (0x11fc0, 0x11fd4),
+                  (0x12400, 0x1246e), (0x16b5b, 0x16b61), (0x16e80, 0x16e96), (0x1d2e0, 0x1d2f3),
+                  (0x1d360, 0x1d378), (0x1e8c7, 0x1e8cf), (0x1ec71, 0x1ecab), (0x1ecad, 0x1ecaf),
+                  (0x1ecb1, 0x1ecb4), (0x1ed01, 0x1ed2d), (0x1ed2f, 0x1ed3d), (0x1f100, 0x1f10c)]
+
+NUMERIC_PATTERN = re.compile("([" +
+                             "".join("\\U{0:08x}-\\U{1:08x}".format(first, last)
+                                     for first, last in NUMERIC_RANGES) +
+                             "])")
+
+
+def split_numeric_characters(tokens):
+    split_tokens = []
+    for token in tokens:
+        if len(token) > 1 and NUMERIC_PATTERN.search(token):
+            split_tokens.extend(filter(None, NUMERIC_PATTERN.split(token)))
+        else:
+            split_tokens.append(token)
+    return split_tokens
+
+
+def tokenize_uninterned(text):
+    tokens = TOKEN_PATTERN.findall(text)
+    if not text.isascii() and NUMERIC_PATTERN.search(text):
+        tokens = split_numeric_characters(tokens)
+    return tokens
+
+
+def tokenize(text):
+    return list(map(sys.intern, tokenize_uninterned(text)))
+
+
+def iterate_tokens(texts, worker_count = 1, chunk_size = 10000):
+    # Yields the tokens of every text in order, optionally tokenizing them
+    # in a process pool.
+    texts = list(texts)
+    bar = progressbar.ProgressBar(max_value = len(texts), prefix = "Tokenizing ")
+    if worker_count <= 1:
+        pool = None
+        tokens = map(tokenize_uninterned, texts)
+    else:
+        pool = multiprocessing.Pool(worker_count)
+        tokens = pool.imap(tokenize_uninterned, texts, chunk_size)
+    try:
+        for i, text_tokens in enumerate(tokens, 1):
+            yield text_tokens
+            if i % chunk_size == 0:
+                bar.update(i)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    bar.finish()
+
+
+def tokenize_texts(texts, worker_count = 1, chunk_size = 10000):
+    # Tokenizes every text. Tokens are interned, so a word occurring many
+    # times is stored only once (interning does not survive the pickling
+    # between processes, so it happens here).
+    return [list(map(sys.intern, text_tokens))
+            for text_tokens in iterate_tokens(texts, worker_count, chunk_size)]
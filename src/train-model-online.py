@@ -0,0 +1,244 @@
+from sklearn.metrics import precision_score, recall_score, f1_score, accuracy_score
+import collections
+import hashlib
+import joblib
+import numpy as np
+import os
+import progressbar
+import scipy.sparse
+import time
+import argparse
+from training import initialize_model, load_features
+
+# Incremental training of partial_fit estimators on feature rows streamed
+# from disk in batches. The model is checkpointed along with the number of
+# rows it has seen, so a later run on a feature file that has grown only
+# learns from the new rows. Every batch is scored before it is learnt from
+# (prequential evaluation); the scores of the last batches make up the
+# rolling evaluation saved with every checkpoint. Digests of the rows seen
+# are checkpointed too, so that features extracted again differently
+# (another n-gram dimension, another row order) start the training over.
+
+ONLINE_MODEL_CLASSES = ["SGDClassifier", "MultinomialNB", "PassiveAggressiveClassifier"]
+
+SCORE_HEADER = "Rows, Accuracy, Precision, Recall, F1, Time"
+
+FINGERPRINT_CHUNK_SIZE = 100000
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description = ("Train a model incrementally on " +
+                                                    "the feature rows it has not seen yet"))
+    parser.add_argument('x_filepath',
+                        metavar = 'x-filepath',
+                        type = str,
+                        help = "npy or npz file containing the features")
+    parser.add_argument('y_filepath',
+                        metavar = 'y-filepath',
+                        type = str,
+                        help = "npy file containing the class labels")
+    parser.add_argument("model_class",
+                        metavar = "model-class",
+                        type = str,
+                        choices = ONLINE_MODEL_CLASSES,
+                        help = "name of the sklearn model class")
+    parser.add_argument("model_parameters",
+                        metavar = "model-parameters",
+                        type = str,
+                        help = "parameters passed to the model being trained")
+    parser.add_argument("checkpoint_filepath",
+                        metavar = "checkpoint-filepath",
+                        type = str,
+                        help = "file containing the model and the number of rows it has seen")
+    parser.add_argument("raw_model_score_filepath",
+                        metavar = "raw-model-score-filepath",
+                        type = str,
+                        help = "file containing the score of every batch")
+    parser.add_argument("aggregated_model_score_filepath",
+                        metavar = "aggregated-model-score-filepath",
+                        type = str,
+                        help = "file containing the rolling score over the last batches")
+    parser.add_argument("--batch-size",
+                        type = int,
+                        default = 10000,
+                        help = "number of rows learnt from at once")
+    parser.add_argument("--checkpoint-interval",
+                        type = int,
+                        default = 10,
+                        help = "number of batches between checkpoints")
+    parser.add_argument("--window",
+                        type = int,
+                        default = 10,
+                        help = "number of last batches the rolling score is computed over")
+
+    return parser.parse_args()
+
+
+def digest_rows(X, Y, start, end):
+    digest = hashlib.sha1()
+    digest.update(repr((X.shape[1], X.dtype.str, Y.dtype.str)).encode())
+    rows = X[start:end]
+    if scipy.sparse.issparse(rows):
+        for array in (rows.indptr, rows.indices, rows.data):
+            digest.update(np.ascontiguousarray(array).tobytes())
+    else:
+        digest.update(np.ascontiguousarray(rows).tobytes())
+    digest.update(np.ascontiguousarray(Y[start:end]).tobytes())
+    return digest.hexdigest()
+
+
+def fingerprint_rows(X, Y, row_count, digests = ()):
+    # (end, digest) pairs of the first row_count rows, FINGERPRINT_CHUNK_SIZE
+    # rows at a time; the digests of complete chunks are taken from digests
+    # rather than computed again
+    digests = [(end, digest) for end, digest in digests
+               if end % FINGERPRINT_CHUNK_SIZE == 0 and end <= row_count]
+    start = digests[-1][0] if len(digests) > 0 else 0
+    for chunk_start in range(start, row_count, FINGERPRINT_CHUNK_SIZE):
+        chunk_end = min(chunk_start + FINGERPRINT_CHUNK_SIZE, row_count)
+        digests.append((chunk_end, digest_rows(X, Y, chunk_start, chunk_end)))
+    return digests
+
+
+def initialize_checkpoint(model_class, model_parameters, classes):
+    return {"model_class": model_class,
+            "model_parameters": model_parameters,
+            "model": initialize_model(model_class, model_parameters),
+            "classes": classes,
+            "row_count": 0,
+            "row_digests": [],
+            "scores": []}
+
+
+def load_checkpoint(filepath, model_class, model_parameters, X, Y):
+    # Resumes from the checkpoint if it was made by the same model on a
+    # prefix of the current rows. Classes cannot be added to a fitted
+    # model, so new labels start the training over.
+    classes = np.unique(Y)
+    if not os.path.exists(filepath):
+        return initialize_checkpoint(model_class, model_parameters, classes)
+
+    checkpoint = joblib.load(filepath)
+    if (checkpoint["model_class"] != model_class or
+            checkpoint["model_parameters"] != model_parameters):
+        print("Model changed, training from scratch")
+    elif checkpoint["row_count"] > len(Y):
+        print("Fewer rows than already seen, training from scratch")
+    elif not np.isin(classes, checkpoint["classes"]).all():
+        print("New classes, training from scratch")
+    elif checkpoint.get("row_digests") != fingerprint_rows(X, Y, checkpoint["row_count"]):
+        print("Rows already seen changed, training from scratch")
+    else:
+        return checkpoint
+    return initialize_checkpoint(model_class, model_parameters, classes)
+
+
+def save_checkpoint(filepath, checkpoint):
+    temporary_filepath = filepath + ".tmp"
+    joblib.dump(checkpoint, temporary_filepath)
+    os.replace(temporary_filepath, filepath)
+
+
+def score_batch(Y_true, Y_pred):
+    return [accuracy_score(Y_true, Y_pred),
+            precision_score(Y_true, Y_pred, average = "weighted", zero_division = 0),
+            recall_score(Y_true, Y_pred, average = "weighted", zero_division = 0),
+            f1_score(Y_true, Y_pred, average = "weighted", zero_division = 0)]
+
+
+def save_scores(raw_score_filepath, aggregated_score_filepath, checkpoint, new_scores):
+    # The batch scores are appended to the raw scores; the rolling scores
+    # are the mean and standard deviation over the last batches
+    with open(raw_score_filepath, "a") as f:
+        if f.tell() == 0:
+            f.write(SCORE_HEADER + "\n")
+        np.savetxt(f, np.array(new_scores).reshape(-1, 6),
+                   fmt = ["%d"] + ["%.18e"] * 5,
+                   delimiter = ",")
+
+    if len(checkpoint["scores"]) > 0:
+        scores = np.array(checkpoint["scores"])
+        np.savetxt(aggregated_score_filepath,
+                   np.array([np.mean(scores, axis = 0), np.std(scores, axis = 0)]),
+                   comments = "",
+                   delimiter = ",",
+                   header = SCORE_HEADER)
+
+
+def train_online(checkpoint, X, Y, batch_size, on_checkpoint, checkpoint_interval, window):
+    model = checkpoint["model"]
+    row_count = len(Y)
+    start = checkpoint["row_count"]
+    print("Seen:", start, "rows, new:", row_count - start, "rows")
+
+    recent_scores = collections.deque(checkpoint["scores"], maxlen = window)
+    new_scores = []
+    bar = progressbar.ProgressBar(max_value = row_count - start)
+    for batch_index, batch_start in enumerate(range(start, row_count, batch_size)):
+        batch_end = min(batch_start + batch_size, row_count)
+        X_batch = X[batch_start:batch_end]
+        Y_batch = Y[batch_start:batch_end]
+
+        start_time = time.time()
+        if batch_start > 0:
+            scores = score_batch(Y_batch, model.predict(X_batch))
+        model.partial_fit(X_batch, Y_batch, classes = checkpoint["classes"])
+        elapsed = time.time() - start_time
+
+        if batch_start > 0:
+            recent_scores.append(scores + [elapsed])
+            new_scores.append([batch_end] + scores + [elapsed])
+
+        checkpoint["row_count"] = batch_end
+        checkpoint["scores"] = list(recent_scores)
+        if (batch_index + 1) % checkpoint_interval == 0 or batch_end == row_count:
+            checkpoint["row_digests"] = fingerprint_rows(X, Y, batch_end,
+                                                         checkpoint["row_digests"])
+            on_checkpoint(checkpoint, new_scores)
+            new_scores = []
+
+        bar.update(batch_end - start)
+    bar.finish()
+
+    if len(recent_scores) > 0:
+        print("Rolling Accuracy, Precision, Recall, F1, Time:",
+              " ".join("{0:.2f}".format(score) for score in np.mean(recent_scores, axis = 0)))
+
+
+def main():
+    args = parse_arguments()
+
+    print("#" * 80)
+    print("Model:                         ", args.model_class)
+    print("Parameters:                    ", args.model_parameters)
+    print("X:                             ", args.x_filepath)
+    print("Y:                             ", args.y_filepath)
+    print("Checkpoint Filepath:           ", args.checkpoint_filepath)
+
+    X = load_features(args.x_filepath)
+    Y = load_features(args.y_filepath)
+
+    checkpoint = load_checkpoint(args.checkpoint_filepath,
+                                 args.model_class,
+                                 args.model_parameters,
+                                 X, Y)
+    if checkpoint["row_count"] == 0 and os.path.exists(args.raw_model_score_filepath):
+        os.remove(args.raw_model_score_filepath)
+
+    def on_checkpoint(checkpoint, new_scores):
+        save_scores(args.raw_model_score_filepath,
+                    args.aggregated_model_score_filepath,
+                    checkpoint,
+                    new_scores)
+        save_checkpoint(args.checkpoint_filepath, checkpoint)
+
+    train_online(checkpoint, X, Y,
+                 args.batch_size,
+                 on_checkpoint,
+                 args.checkpoint_interval,
+                 args.window)
+
+    print("#" * 80)
+
+if __name__ =="__main__":
+    main()
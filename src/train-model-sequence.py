@@ -1,54 +1,322 @@
-from subprocess import call
-import os
 import argparse
+import collections
+import concurrent.futures
+import hashlib
+import os
+import sys
+import threadpoolctl
+import time
+import traceback
+from evaluation import Evaluator
+from model_store import ModelStore, make_metadata, metadata_filepath, save_model
+from training import initialize_model, train_model, load_features
+import sweep
+
+
+Job = collections.namedtuple("Job", ["model_name",
+                                     "model_class",
+                                     "model_parameters",
+                                     "feature",
+                                     "x_filepath",
+                                     "model_feature_dirpath",
+                                     "sweep_grid"])
+
+
+def find_feature_filepath(x_dirpath, feature):
+    # A feature set is stored either sparse (npz) or dense (npy); should
+    # both exist, the one written last is the current one
+    sparse_filepath = os.path.join(x_dirpath, feature + ".npz")
+    dense_filepath = os.path.join(x_dirpath, feature + ".npy")
+    if not os.path.exists(sparse_filepath):
+        return dense_filepath
+    if not os.path.exists(dense_filepath):
+        return sparse_filepath
+    return max([sparse_filepath, dense_filepath], key = os.path.getmtime)
+
+
+def job_cpu_count(job, cpu_budget):
+    # The number of CPUs a job keeps busy, as far as its n_jobs parameter
+    # tells (negative values count back from the number of CPUs). The
+    # BLAS and OpenMP thread pools of the job are capped to as many
+    # threads.
+    n_jobs = job.model_parameters.get("n_jobs", 1)
+    if n_jobs is None:
+        n_jobs = 1
+    if n_jobs < 0:
+        n_jobs = cpu_budget + 1 + n_jobs
+    return max(1, min(n_jobs, cpu_budget))
+
+
+def fingerprint_file(filepath, block_size = 64 * 1024 * 1024):
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint_job(job, file_fingerprints, y_filepath, n_splits, random_state,
+                    halving_factor):
+    # Everything the evaluation of a job depends on; a job whose stored
+    # fingerprint differs is stale and trained again
+    digest = hashlib.sha1()
+    digest.update(repr((job.model_class,
+                        sorted(job.model_parameters.items()),
+                        file_fingerprints[job.x_filepath],
+                        file_fingerprints[y_filepath],
+                        n_splits,
+                        random_state)).encode())
+    if job.sweep_grid is not None:
+        digest.update(repr((sorted(job.sweep_grid.items()),
+                            halving_factor)).encode())
+    return digest.hexdigest()
+
+
+def job_filepaths(job):
+    # A sweep job has no single model or evaluation, its summary stands
+    # for the aggregated evaluation
+    if job.sweep_grid is not None:
+        return (None,
+                None,
+                os.path.join(job.model_feature_dirpath, "summary.txt"),
+                os.path.join(job.model_feature_dirpath, "fingerprint.txt"))
+    return (os.path.join(job.model_feature_dirpath, "model.pkl"),
+            os.path.join(job.model_feature_dirpath, "evaluation-raw.txt"),
+            os.path.join(job.model_feature_dirpath, "evaluation-aggregated.txt"),
+            os.path.join(job.model_feature_dirpath, "fingerprint.txt"))
+
+
+def is_job_completed(job, fingerprint):
+    model_filepath, _, agg_eval_filepath, fingerprint_filepath = job_filepaths(job)
+    if not os.path.exists(agg_eval_filepath) or not os.path.exists(fingerprint_filepath):
+        return False
+    if model_filepath is not None and not os.path.exists(metadata_filepath(model_filepath)):
+        return False
+    with open(fingerprint_filepath) as f:
+        return f.read().strip() == fingerprint
+
+
+def run_job(job, fingerprint, y_filepath, n_splits, random_state, halving_factor,
+            thread_count):
+    # Left alone, numpy and scikit-learn start as many threads as there are
+    # CPUs in every worker, whatever the budget
+    with threadpoolctl.threadpool_limits(limits = thread_count):
+        return run_job_with_threads(job, fingerprint, y_filepath, n_splits, random_state,
+                                    halving_factor)
+
+
+def run_job_with_threads(job, fingerprint, y_filepath, n_splits, random_state,
+                         halving_factor):
+    start_time = time.time()
+
+    print("Sweeping" if job.sweep_grid is not None else "Training",
+          job.model_name, "on", job.feature)
+
+    os.makedirs(job.model_feature_dirpath, exist_ok = True)
+
+    model_filepath, raw_eval_filepath, agg_eval_filepath, fingerprint_filepath = job_filepaths(job)
+
+    # The fingerprint is written last, so that a job interrupted half way
+    # is never taken for a completed one
+    if os.path.exists(fingerprint_filepath):
+        os.remove(fingerprint_filepath)
+
+    X = load_features(job.x_filepath)
+    Y = load_features(y_filepath)
+
+    if job.sweep_grid is not None:
+        sweep.sweep_model(job.model_class,
+                          job.model_parameters,
+                          job.sweep_grid,
+                          X, Y,
+                          job.model_feature_dirpath,
+                          n_splits,
+                          random_state,
+                          halving_factor)
+    else:
+        model = initialize_model(job.model_class, str(job.model_parameters))
+
+        evaluator = Evaluator(n_splits)
+
+        train_start_time = time.time()
+        model = train_model(model, X, Y,
+                            evaluator,
+                            n_splits,
+                            random_state)
+
+        evaluator.save(raw_eval_filepath, agg_eval_filepath)
+
+        save_model(model,
+                   model_filepath,
+                   make_metadata(job.model_name,
+                                 job.model_class,
+                                 str(job.model_parameters),
+                                 job.x_filepath,
+                                 evaluator,
+                                 time.time() - train_start_time))
+
+    with open(fingerprint_filepath, "w") as f:
+        f.write(fingerprint + "\n")
+
+    return time.time() - start_time
 
 
 def train_model_sequence(model_name_class_parameter_mapping,
                          features,
-                         python_binpath,
                          x_dirpath,
                          y_filepath,
                          n_splits,
                          random_state,
-                         model_dirpath):
+                         model_dirpath,
+                         cpu_count,
+                         resume = False,
+                         sweep_grids = None,
+                         halving_factor = 2):
+    # With sweep_grids, a mapping of model names to parameter grids, the
+    # grids of these models are swept in addition, into
+    # <model>/<feature>/sweep/<point>
 
+    jobs = []
+    for model_name, model_class, model_parameters in model_name_class_parameter_mapping:
+        for feature in features:
+            jobs.append(Job(model_name,
+                            model_class,
+                            model_parameters,
+                            feature,
+                            find_feature_filepath(x_dirpath, feature),
+                            os.path.join(model_dirpath, model_name, feature),
+                            None))
     for model_name, model_class, model_parameters in model_name_class_parameter_mapping:
+        if sweep_grids is None or model_name not in sweep_grids:
+            continue
         for feature in features:
-            x_filepath = os.path.join(x_dirpath, feature + ".npy")
-            model_feature_dirpath = os.path.join(model_dirpath, model_name, feature)
-            os.makedirs(model_feature_dirpath)
+            jobs.append(Job(model_name,
+                            model_class,
+                            model_parameters,
+                            feature,
+                            find_feature_filepath(x_dirpath, feature),
+                            os.path.join(model_dirpath, model_name, feature, "sweep"),
+                            sweep_grids[model_name]))
+
+    file_fingerprints = {}
+    for filepath in set(job.x_filepath for job in jobs) | {y_filepath}:
+        if os.path.exists(filepath):
+            file_fingerprints[filepath] = fingerprint_file(filepath)
+
+    results = [None] * len(jobs)
+    fingerprints = [None] * len(jobs)
+    queue = collections.deque()
+    for index, job in enumerate(jobs):
+        if job.x_filepath in file_fingerprints and y_filepath in file_fingerprints:
+            fingerprints[index] = fingerprint_job(job,
+                                                  file_fingerprints,
+                                                  y_filepath,
+                                                  n_splits,
+                                                  random_state,
+                                                  halving_factor)
+            if resume and is_job_completed(job, fingerprints[index]):
+                results[index] = (job, "skipped", None)
+                continue
+        queue.append((index, job))
 
-            model_filepath = os.path.join(model_feature_dirpath, "model.pkl")
-            raw_eval_filepath = os.path.join(model_feature_dirpath, "evaluation-raw.txt")
-            agg_eval_filepath = os.path.join(model_feature_dirpath, "evaluation-aggregated.txt")
+    # Jobs are started in order, as long as the CPUs they keep busy fit in
+    # the budget. A job needing more than what is left waits for running
+    # jobs to finish, unless nothing is running.
+    #
+    # A worker dying (killed for lack of memory, for instance) breaks the
+    # pool, failing every job in it. These jobs are run again in a new
+    # pool, one at a time, so that only the job that kills its worker
+    # while running alone fails.
+    running = {}
+    isolated = set()
+    used_cpu_count = 0
 
-            command = [python_binpath,
-                       "src/train-model.py",
-                       x_filepath,
-                       y_filepath,
-                       str(n_splits),
-                       str(random_state),
-                       model_class,
-                       str(model_parameters),
-                       model_filepath,
-                       raw_eval_filepath,
-                       agg_eval_filepath]
+    def can_start(index):
+        if len(running) == 0:
+            return True
+        if index in isolated or any(i in isolated for i in running.values()):
+            return False
+        return used_cpu_count + job_cpu_count(jobs[index], cpu_count) <= cpu_count
 
-            retcode = call(command)
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers = cpu_count)
+    pool_broken = False
+    broken_indices = []
+    try:
+        while len(queue) > 0 or len(running) > 0:
+            while not pool_broken and len(queue) > 0 and can_start(queue[0][0]):
+                index, job = queue.popleft()
+                try:
+                    future = executor.submit(run_job,
+                                             job,
+                                             fingerprints[index],
+                                             y_filepath,
+                                             n_splits,
+                                             random_state,
+                                             halving_factor,
+                                             job_cpu_count(job, cpu_count))
+                except concurrent.futures.process.BrokenProcessPool:
+                    queue.appendleft((index, job))
+                    pool_broken = True
+                    break
+                running[future] = index
+                used_cpu_count += job_cpu_count(job, cpu_count)
 
-            if retcode != 0:
-                print("Return code != 0, exiting ...")
-                exit(0)
+            if len(running) > 0:
+                # Once the pool is broken, all the jobs still in it fail
+                done, _ = concurrent.futures.wait(
+                    running,
+                    return_when = (concurrent.futures.ALL_COMPLETED if pool_broken
+                                   else concurrent.futures.FIRST_COMPLETED))
+                for future in done:
+                    index = running.pop(future)
+                    job = jobs[index]
+                    used_cpu_count -= job_cpu_count(job, cpu_count)
+                    try:
+                        results[index] = (job, "done", future.result())
+                    except concurrent.futures.process.BrokenProcessPool:
+                        pool_broken = True
+                        broken_indices.append(index)
+                    except Exception:
+                        print("Failed:", job.model_name, "on", job.feature)
+                        traceback.print_exc()
+                        results[index] = (job, "failed", None)
+
+            if pool_broken and len(running) == 0:
+                executor.shutdown(wait = True)
+                executor = concurrent.futures.ProcessPoolExecutor(max_workers = cpu_count)
+                if len(broken_indices) == 1:
+                    index = broken_indices[0]
+                    print("Failed:", jobs[index].model_name, "on", jobs[index].feature,
+                          "(its worker died)")
+                    results[index] = (jobs[index], "failed", None)
+                else:
+                    for index in sorted(broken_indices, reverse = True):
+                        queue.appendleft((index, jobs[index]))
+                        isolated.add(index)
+                pool_broken = False
+                broken_indices = []
+    finally:
+        executor.shutdown(wait = True)
+        ModelStore(model_dirpath).rebuild_index()
+
+    return results
+
+
+def print_report(results):
+    print("#" * 80)
+    for job, status, seconds in results:
+        print("{0:<20} {1:<28} {2:<8} {3}".format(
+            job.model_name,
+            job.feature + (" (sweep)" if job.sweep_grid is not None else ""),
+            status,
+            "" if seconds is None else "{0:.2f} Seconds".format(seconds)))
+    print("#" * 80)
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description = ("Train a sequence of models " +
                                                     "on the given set of features " +
                                                     "and evaluate their performance"))
-    parser.add_argument('python_binpath',
-                        metavar = 'python-binpath',
-                        type = str,
-                        help = "python binary with which to train the models")
     parser.add_argument('x_dirpath',
                         metavar = 'x-dirpath',
                         type = str,
@@ -69,6 +337,28 @@ def parse_arguments():
                         metavar = "model-dirpath",
                         type = str,
                         help = "directory containing the trained model hierarchy")
+    parser.add_argument("--cpu-count",
+                        type = int,
+                        default = os.cpu_count(),
+                        help = "number of CPUs the models are trained on concurrently")
+    parser.add_argument("--resume",
+                        action = "store_true",
+                        help = ("skip the models already trained and evaluated " +
+                                "with the same parameters on the same features"))
+    parser.add_argument("--sweep",
+                        action = "store_true",
+                        help = ("also sweep the parameter grids of the ensemble models, " +
+                                "growing them with warm start and pruning by successive halving"))
+    parser.add_argument("--halving-factor",
+                        type = int,
+                        default = 2,
+                        help = "fraction (1 / factor) of the configurations kept at every sweep step")
+    parser.add_argument("--approximate-knn",
+                        metavar = "PROBE_COUNT",
+                        type = int,
+                        default = None,
+                        help = ("replace the exact KNN models by approximate ones, " +
+                                "searching this many lists of their index"))
 
     return parser.parse_args()
 
@@ -98,15 +388,42 @@ def main():
         ("NN", "MLPClassifier", {'hidden_layer_sizes': (100,), "max_iter": 1000})
     ]
 
-    train_model_sequence(model_name_class_parameter_mapping,
-                         features,
-                         args.python_binpath,
-                         args.x_dirpath,
-                         args.y_filepath,
-                         args.n_splits,
-                         args.random_state,
-                         args.model_dirpath)
+    if args.approximate_knn is not None:
+        model_name_class_parameter_mapping = [
+            ("ANN-" + parameters["metric"],
+             "ApproximateKNeighborsClassifier",
+             dict(parameters, n_probe = args.approximate_knn, random_state = 55861))
+            if model_class == "KNeighborsClassifier" else (model_name, model_class, parameters)
+            for model_name, model_class, parameters in model_name_class_parameter_mapping]
+
+    sweep_grids = {
+        "RandomForest": {"n_estimators": [50, 100, 200, 400],
+                         "max_features": ["sqrt", "log2", None]},
+        "ExtraTrees": {"n_estimators": [50, 100, 200, 400],
+                       "max_features": ["sqrt", "log2", None]},
+        "GradientBoosting": {"n_estimators": [50, 100, 200, 400],
+                             "learning_rate": [0.05, 0.1, 0.2],
+                             "max_depth": [3, 5]},
+        "Bagging": {"n_estimators": [10, 20, 40, 80],
+                    "max_samples": [0.5, 1.0]}
+    }
+
+    results = train_model_sequence(model_name_class_parameter_mapping,
+                                   features,
+                                   args.x_dirpath,
+                                   args.y_filepath,
+                                   args.n_splits,
+                                   args.random_state,
+                                   args.model_dirpath,
+                                   args.cpu_count,
+                                   args.resume,
+                                   sweep_grids if args.sweep else None,
+                                   args.halving_factor)
+
+    print_report(results)
 
+    if any(status == "failed" for _, status, _ in results):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
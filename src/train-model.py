@@ -1,40 +1,10 @@
-from sklearn.svm import LinearSVC
-from sklearn.naive_bayes import GaussianNB
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.neural_network import MLPClassifier
-from sklearn.ensemble import GradientBoostingClassifier
-from sklearn.ensemble import BaggingClassifier
-from sklearn.ensemble import AdaBoostClassifier
-from sklearn.ensemble import ExtraTreesClassifier
-from sklearn.model_selection import StratifiedKFold
-from sklearn.externals import joblib
 import numpy as np
 import argparse
+import os
+import time
 from evaluation import Evaluator
-
-
-def initialize_model(model_class, model_parameters):
-    parameters = eval(model_parameters)
-    return eval(model_class + "(**parameters)")
-
-
-def train_model(model, X, Y, evaluator,
-                n_splits = 5, random_state = 55861):
-    kfold = StratifiedKFold(n_splits = n_splits,
-                            shuffle = True,
-                            random_state = random_state)
-    splits = kfold.split(X, Y)
-
-    evaluator.begin()
-    for train_indices, test_indices in splits:
-        X_train, X_test = X[train_indices], X[test_indices]
-        Y_train, Y_test = Y[train_indices], Y[test_indices]
-        model.fit(X_train, Y_train)
-        Y_pred = model.predict(X_test)
-        evaluator.evaluate(Y_test, Y_pred)
-
-    evaluator.finish()
+from model_store import ModelStore, make_metadata, save_model
+from training import initialize_model, train_model, load_features
 
 
 def parse_arguments():
@@ -77,6 +47,14 @@ def parse_arguments():
                         metavar = "aggregated-model-score-filepath",
                         type = str,
                         help = "file containing aggregated model score")
+    parser.add_argument("--fold-worker-count",
+                        type = int,
+                        default = 1,
+                        help = "number of processes fitting cross validation folds in parallel")
+    parser.add_argument("--model-store-dirpath",
+                        type = str,
+                        default = None,
+                        help = "root of the model store whose index the model is added to")
 
     return parser.parse_args()
 
@@ -98,21 +76,34 @@ def main():
     model = initialize_model(args.model_class,
                              args.model_parameters)
 
-    X = np.load(args.x_filepath)
+    X = load_features(args.x_filepath)
 
-    Y = np.load(args.y_filepath)
+    Y = load_features(args.y_filepath)
 
     evaluator = Evaluator(args.n_splits)
 
-    train_model(model, X, Y,
-                evaluator,
-                args.n_splits,
-                args.random_state)
+    start_time = time.time()
+    model = train_model(model, X, Y,
+                        evaluator,
+                        args.n_splits,
+                        args.random_state,
+                        args.fold_worker_count)
 
     evaluator.save(args.raw_model_score_filepath,
                    args.aggregated_model_score_filepath)
 
-    joblib.dump(model, args.model_filepath)
+    # The model is named after its file and indexed with the other models
+    # of the store it belongs to
+    save_model(model,
+               args.model_filepath,
+               make_metadata(os.path.splitext(os.path.basename(args.model_filepath))[0],
+                             args.model_class,
+                             args.model_parameters,
+                             args.x_filepath,
+                             evaluator,
+                             time.time() - start_time))
+    if args.model_store_dirpath is not None:
+        ModelStore(args.model_store_dirpath).rebuild_index()
 
     print("#" * 80)
 
@@ -0,0 +1,104 @@
+from sklearn.svm import LinearSVC
+from sklearn.naive_bayes import GaussianNB
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.linear_model import SGDClassifier
+from sklearn.linear_model import PassiveAggressiveClassifier
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.ensemble import BaggingClassifier
+from sklearn.ensemble import AdaBoostClassifier
+from sklearn.ensemble import ExtraTreesClassifier
+from sklearn.model_selection import StratifiedKFold
+from sklearn.neighbors import VALID_METRICS_SPARSE
+from sklearn.base import clone
+from sklearn.utils import get_tags
+from ann import ApproximateKNeighborsClassifier
+import joblib
+import numpy as np
+import scipy.sparse
+import time
+import utils
+
+
+def initialize_model(model_class, model_parameters):
+    parameters = eval(model_parameters)
+    return eval(model_class + "(**parameters)")
+
+
+def accepts_sparse(model):
+    if isinstance(model, KNeighborsClassifier):
+        return (model.metric == "minkowski" or
+                model.metric in VALID_METRICS_SPARSE["brute"])
+    return get_tags(model).input_tags.sparse
+
+
+def prepare_features(model, X):
+    # Sparse features are densified, a fold at a time, only for the
+    # models that cannot take them as they are
+    if scipy.sparse.issparse(X) and not accepts_sparse(model):
+        return X.toarray()
+    return X
+
+
+def split_folds(X, Y, n_splits = 5, random_state = 55861):
+    kfold = StratifiedKFold(n_splits = n_splits,
+                            shuffle = True,
+                            random_state = random_state)
+    return list(kfold.split(X, Y))
+
+
+def predict_rows(model, X, indices, batch_size = 65536):
+    # Predicts the given rows batch by batch straight from the (memory
+    # mapped) features, without gathering them all into memory
+    return np.concatenate([model.predict(prepare_features(model, X[indices[i:i + batch_size]]))
+                           for i in range(0, len(indices), batch_size)])
+
+
+def fit_predict_fold(model, X, Y, train_indices, test_indices):
+    # Only the training fold is gathered into memory. The fold indices are
+    # sorted, so both the fit and the prediction read X front to back.
+    start_time = time.time()
+    model.fit(prepare_features(model, X[train_indices]), Y[train_indices])
+    Y_pred = predict_rows(model, X, test_indices)
+    return model, Y_pred, time.time() - start_time
+
+
+def train_model(model, X, Y, evaluator,
+                n_splits = 5, random_state = 55861,
+                fold_worker_count = 1):
+    # Returns the model fitted on the last fold. With more than one fold
+    # worker every fold fits its own clone of the model in a separate
+    # process; X and Y are memory mapped into the workers rather than
+    # copied. The scores are reported in fold order either way.
+    splits = split_folds(X, Y, n_splits, random_state)
+
+    evaluator.begin()
+    if fold_worker_count == 1:
+        for train_indices, test_indices in splits:
+            model, Y_pred, elapsed = fit_predict_fold(model, X, Y,
+                                                      train_indices,
+                                                      test_indices)
+            evaluator.evaluate(Y[test_indices], Y_pred, elapsed = elapsed)
+    else:
+        folds = joblib.Parallel(n_jobs = fold_worker_count)(
+            joblib.delayed(fit_predict_fold)(clone(model), X, Y,
+                                             train_indices,
+                                             test_indices)
+            for train_indices, test_indices in splits)
+        for (_, test_indices), (model, Y_pred, elapsed) in zip(splits, folds):
+            evaluator.evaluate(Y[test_indices], Y_pred, elapsed = elapsed)
+
+    evaluator.finish()
+
+    return model
+
+
+def load_features(filepath):
+    # Memory mapped, so concurrent training processes share the pages of
+    # the same feature file instead of each holding a private copy. Sparse
+    # npz files cannot be mapped and are read into memory.
+    if utils.is_sparse_file(filepath):
+        return scipy.sparse.load_npz(filepath).tocsr()
+    return np.load(filepath, mmap_mode = "r")
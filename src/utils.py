@@ -1,13 +1,45 @@
 import numpy as np
+import os
 import pandas as pd
 from collections import Counter
 import matplotlib.pyplot as plt
 import nltk
 from sklearn.model_selection import StratifiedKFold
 
-def read_data_from_file(filename):
+def set_default_permissions(filepath):
+    # Files made by tempfile.mkstemp are only readable by their owner; this
+    # gives them the permissions of a file created with open()
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(filepath, 0o666 & ~umask)
+
+
+def is_parquet_file(filename):
+    return filename.endswith('.parquet')
+
+
+def is_sparse_file(filename):
+    return filename.endswith('.npz')
+
+
+def read_data_from_file(filename, columns = None):
+    # Parquet files are columnar, so only the requested columns are read
+    # from disk. Pickle files have to be loaded whole before projecting.
     print('Reading tweets from:', filename)
-    return pd.read_pickle(filename)
+    if is_parquet_file(filename):
+        return pd.read_parquet(filename, columns = columns)
+    data = pd.read_pickle(filename)
+    if columns is not None:
+        data = data[columns]
+    return data
+
+
+def write_data_to_file(data, filename):
+    if is_parquet_file(filename):
+        data.to_parquet(filename)
+    else:
+        data.to_pickle(filename)
+    print('Written to:', filename)
 
 def get_X_y(tweets):
     x_cols = [col for col in tweets.columns if col != 'user_id']
@@ -54,3 +86,90 @@ def extract_features(tweets, eliminate = []):
     columns = list(set(tweets.columns) - set(eliminate))
     columns.sort()
     return tweets[columns]
+
+
+ALPHA, DIGIT, SPACE = 1, 2, 4
+
+
+def count_character_classes(texts):
+    # Counts, for every text at once, the characters of each class that the
+    # linguistic features are built from. The texts are concatenated and
+    # handled as one array of code points; the character classes are only
+    # looked up once per distinct code point.
+    lengths = np.fromiter(map(len, texts), dtype = np.int64, count = len(texts))
+    starts = np.cumsum(lengths) - lengths
+    codes = np.frombuffer("".join(texts).encode("utf-32-le", "surrogatepass"),
+                          dtype = np.uint32)
+
+    classes = np.zeros(int(codes.max()) + 1 if len(codes) > 0 else 0, dtype = np.uint8)
+    for code in np.flatnonzero(np.bincount(codes)):
+        c = chr(code)
+        classes[code] = ((ALPHA if c.isalpha() else 0) |
+                         (DIGIT if c.isdigit() else 0) |
+                         (SPACE if c.isspace() else 0))
+    code_classes = classes[codes]
+
+    is_space = (code_classes & SPACE) != 0
+    is_period = codes == ord('.')
+
+    def is_preceded_by(is_separator):
+        # True for the first character of every text and for characters
+        # following a separator
+        preceded = np.ones(len(codes), dtype = bool)
+        preceded[1:] = is_separator[:-1]
+        preceded[starts[non_empty]] = True
+        return preceded
+
+    non_empty = lengths > 0
+
+    def count(mask):
+        counts = np.zeros(len(texts), dtype = np.int64)
+        if len(codes) > 0:
+            counts[non_empty] = np.add.reduceat(mask.view(np.uint8),
+                                                starts[non_empty],
+                                                dtype = np.int64)
+        return counts
+
+    is_sentence_separator = is_space | is_period
+
+    return {
+        "chars": lengths,
+        "spaces": count(is_space),
+        "periods": count(is_period),
+        "punctuations": count(code_classes == 0),
+        "words": count(~is_space & is_preceded_by(is_space)),
+        "sentence_words": count(~is_sentence_separator &
+                                is_preceded_by(is_sentence_separator))
+    }
+
+
+def safe_divide(numerators, denominators):
+    quotients = np.zeros(len(numerators), dtype = np.float64)
+    np.divide(numerators, denominators, out = quotients, where = denominators != 0)
+    return quotients
+
+
+# Each linguistic feature is computed from the character class counts of
+# count_character_classes. They match avg_chars_per_word,
+# avg_words_per_sentence, num_of_chars and num_of_punctutations.
+LINGUISTIC_FEATURES = [
+    ("avg_chars_per_word",
+     lambda counts: safe_divide(counts["chars"] - counts["spaces"], counts["words"])),
+    ("avg_words_per_sentence",
+     lambda counts: counts["sentence_words"] / (counts["periods"] + 1)),
+    ("num_of_chars",
+     lambda counts: counts["chars"].astype(np.float64)),
+    ("num_of_punctutations",
+     lambda counts: counts["punctuations"].astype(np.float64))
+]
+
+
+def compute_linguistic_features(texts, chunk_size = 100000):
+    texts = list(texts)
+    features = np.zeros((len(texts), len(LINGUISTIC_FEATURES)), dtype = np.float64)
+    for start in range(0, len(texts), chunk_size):
+        end = min(start + chunk_size, len(texts))
+        counts = count_character_classes(texts[start:end])
+        for col_index, (_, feature) in enumerate(LINGUISTIC_FEATURES):
+            features[start:end, col_index] = feature(counts)
+    return features
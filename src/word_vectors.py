@@ -0,0 +1,181 @@
+import hashlib
+import numpy
+import os
+import progressbar
+
+# Word vectors are stored as a plain .npy matrix (one row per word) next to
+# a text file holding one word per line, the line number being the row of
+# the word in the matrix. Both can be read without loading the whole data:
+# the matrix is memory-mapped and the words are streamed.
+
+WORD_VECTOR_DTYPES = {
+    "float64": numpy.float64,
+    "float32": numpy.float32,
+    "float16": numpy.float16
+}
+
+
+def open_text_file(filepath, mode):
+    # Only "\n" separates lines, some of the words contain other line
+    # breaking characters.
+    return open(filepath,
+                mode,
+                encoding = "utf-8",
+                errors = "surrogateescape",
+                newline = "\n")
+
+
+def count_lines(filepath, block_size = 64 * 1024 * 1024):
+    line_count = 0
+    last_block = b""
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            line_count += block.count(b"\n")
+            last_block = block
+    if len(last_block) > 0 and not last_block.endswith(b"\n"):
+        line_count += 1
+    return line_count
+
+
+def convert_word_vectors(word_vector_filepath,
+                         words_filepath,
+                         vectors_filepath,
+                         dtype = "float64",
+                         batch_size = 50000):
+    row_count = count_lines(word_vector_filepath)
+
+    with open_text_file(word_vector_filepath, "r") as word_vector_file:
+        col_count = len(word_vector_file.readline().rstrip("\r\n").split(" ")) - 1
+
+    vectors = numpy.lib.format.open_memmap(vectors_filepath,
+                                           mode = "w+",
+                                           dtype = WORD_VECTOR_DTYPES[dtype],
+                                           shape = (row_count, col_count))
+
+    bar = progressbar.ProgressBar(max_value = row_count)
+
+    def flush(row_index, batch):
+        vectors[row_index - len(batch): row_index] = numpy.array(batch,
+                                                                 dtype = numpy.float64)
+        bar.update(row_index)
+        return []
+
+    with open_text_file(word_vector_filepath, "r") as word_vector_file, \
+         open_text_file(words_filepath, "w") as words_file:
+        batch = []
+        row_index = 0
+        for line in word_vector_file:
+            # A handful of words contain spaces, so the vector is split
+            # from the right.
+            row = line.rstrip("\r\n").rsplit(" ", col_count)
+            words_file.write(row[0] + "\n")
+            batch.append(row[1:])
+            row_index += 1
+            if len(batch) == batch_size:
+                batch = flush(row_index, batch)
+        flush(row_index, batch)
+
+    bar.finish()
+    vectors.flush()
+    del vectors
+
+
+def read_word_index(words_filepath, vocabulary = None):
+    # Maps words to their row in the vector matrix. If a vocabulary is
+    # given, only the words it contains are kept.
+    word_index_mapping = {}
+    with open_text_file(words_filepath, "r") as words_file:
+        for index, line in enumerate(words_file):
+            word = line[:-1]
+            if vocabulary is None or word in vocabulary:
+                word_index_mapping[word] = index
+    return word_index_mapping
+
+
+def load_word_vectors(vectors_filepath):
+    # Only the rows that are actually accessed are read from disk.
+    return numpy.load(vectors_filepath, mmap_mode = "r")
+
+
+def fingerprint_word_vectors(words_filepath,
+                             vectors_filepath,
+                             block_size = 64 * 1024 * 1024):
+    # The words are hashed by content. Hashing the multi-GB vector matrix
+    # would take as long as reading it, so its size and modification time
+    # stand in for its content; a regenerated matrix merely misses the cache.
+    digest = hashlib.sha1()
+    with open(words_filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    vectors_stat = os.stat(vectors_filepath)
+    digest.update(str((vectors_stat.st_size, vectors_stat.st_mtime_ns)).encode())
+    return digest.hexdigest()
+
+
+def load_pruned_word_vectors(words_filepath,
+                             vectors_filepath,
+                             vocabulary,
+                             cache_dirpath,
+                             compaction_ratio = 2):
+    # Returns a word to index mapping and a vector matrix restricted to the
+    # words of the vocabulary that have a vector. The subset is cached per
+    # word vector store: the cache remembers which words have already been
+    # looked up (with or without success), so a slightly different
+    # vocabulary only looks up the words it has not seen yet. Once the
+    # cache holds more than compaction_ratio times the words of the
+    # vocabulary, it is rewritten with these words only.
+    os.makedirs(cache_dirpath, exist_ok = True)
+    cache_filepath = os.path.join(
+        cache_dirpath,
+        fingerprint_word_vectors(words_filepath, vectors_filepath) + ".npz")
+
+    if os.path.exists(cache_filepath):
+        with numpy.load(cache_filepath) as cache:
+            words = cache["words"].tolist()
+            vectors = cache["vectors"]
+            missing_words = cache["missing_words"].tolist()
+    else:
+        word_vector_mapping = load_word_vectors(vectors_filepath)
+        words = []
+        vectors = numpy.empty((0, word_vector_mapping.shape[1]),
+                              dtype = word_vector_mapping.dtype)
+        missing_words = []
+
+    new_words = set(vocabulary) - set(words) - set(missing_words)
+
+    print(f"Word vector cache: {len(vocabulary) - len(new_words)} cached, " +
+          f"{len(new_words)} new words")
+
+    changed = len(new_words) > 0
+    if len(new_words) > 0:
+        word_index_mapping = read_word_index(words_filepath, vocabulary = new_words)
+        found_words = sorted(word_index_mapping, key = word_index_mapping.get)
+        found_indices = [word_index_mapping[word] for word in found_words]
+        vectors = numpy.concatenate([vectors,
+                                     load_word_vectors(vectors_filepath)[found_indices]])
+        words.extend(found_words)
+        missing_words.extend(sorted(new_words - set(found_words)))
+
+    if len(words) + len(missing_words) > compaction_ratio * len(vocabulary):
+        # The words are kept in the order they were cached in, so that
+        # the vectors keep the same order
+        vocabulary = set(vocabulary)
+        kept = numpy.array([word in vocabulary for word in words], dtype = bool)
+        print(f"Word vector cache: dropping {len(words) + len(missing_words) - len(vocabulary)} " +
+              "words no longer in the vocabulary")
+        words = [word for word in words if word in vocabulary]
+        vectors = vectors[kept]
+        missing_words = [word for word in missing_words if word in vocabulary]
+        changed = True
+
+    if changed:
+        temporary_filepath = cache_filepath + ".tmp"
+        with open(temporary_filepath, "wb") as f:
+            numpy.savez(f,
+                        words = numpy.array(words, dtype = str),
+                        vectors = vectors,
+                        missing_words = numpy.array(missing_words, dtype = str))
+        os.replace(temporary_filepath, cache_filepath)
+
+    word_index_mapping = {word: index for index, word in enumerate(words)}
+    return word_index_mapping, vectors